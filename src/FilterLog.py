@@ -0,0 +1,170 @@
+import os
+import struct
+import tempfile
+import zlib
+import numpy as np
+
+# Append-only log of the changes made to a filter, so that replicas can be
+# kept in sync by replaying the changes instead of rebuilding the filter.
+# Each record holds a batch of changes of one kind:
+#   ADD: masks added to the words (the mask of the group in use is set)
+#   ADDSLOW: masks added to the slow memory (for all the groups)
+#   SWAP: groups the words were swapped to (the word is copied from the slow memory)
+# Records are numbered with consecutive sequences. The log can be compacted
+# into a snapshot of the filter, after which it only keeps the later records.
+# A replica then loads the snapshot and replays the records after it, so
+# its cost is proportional to the changes and not to the filter size.
+# The file is laid out as:
+#   header: magic, version, sequence of the last change before the log, hash_groups, lanes
+#   records: sequence, kind, number of changes, crc32 of the payload and payload
+#     (the word indices and either the masks or the groups, as little endian integers)
+class FilterLog:
+
+    MAGIC = b'ABFLOG\0\0'
+    VERSION = 1
+    # magic, version, base sequence, hash_groups, lanes
+    HEADER = struct.Struct('<8sIQQQxxxx')
+    # sequence, kind, number of changes and crc32 of the payload
+    RECORD = struct.Struct('<QBxxxIIxxxx')
+    # kinds of records
+    ADD = 1
+    ADDSLOW = 2
+    SWAP = 3
+
+    # Open the log in filename, creating it for the geometry of the filter
+    # abf if it does not exist
+    def __init__(self, filename, abf=None):
+        # name of the log file
+        self.filename = filename
+        if not os.path.exists(filename):
+            assert abf is not None
+            self.reset(abf.hash_groups, abf.lanes, 0)
+        with open(filename, 'rb') as f:
+            self.base, self.hash_groups, self.lanes = self.header(f)
+        # sequence of the last record, where new records are appended
+        self.sequence = self.base
+        for record in self.records(self.base):
+            self.sequence = record[0]
+        # a record left half written (by a crash) is removed, as the
+        # readers would stop at it and miss the records appended after it
+        if os.path.getsize(filename) > self.end:
+            os.truncate(filename, self.end)
+        self.file = open(filename, 'ab')
+        return
+
+    # Create the log (replacing the current one) with no records after base.
+    # It is written to a temporary file of its own in the same directory
+    # and renamed, so processes resetting the log at once do not clash
+    def reset(self, hash_groups, lanes, base):
+        directory, name = os.path.split(os.path.abspath(self.filename))
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", prefix=name + ".", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION, base, hash_groups, lanes))
+            os.replace(temporary, self.filename)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return
+
+    # Read and check the header of the log. Returns the base sequence, hash_groups and lanes
+    def header(self, f):
+        data = f.read(self.HEADER.size)
+        if len(data) < self.HEADER.size:
+            raise ValueError("%s is not a filter log" % self.filename)
+        magic, version, base, hash_groups, lanes = self.HEADER.unpack(data)
+        if magic != self.MAGIC:
+            raise ValueError("%s is not a filter log" % self.filename)
+        if version != self.VERSION:
+            raise ValueError("%s has version %d, expected %d" % (self.filename, version, self.VERSION))
+        return base, hash_groups, lanes
+
+    # Append a record of the given kind with the changes of the words in
+    # wordidx: the masks (elements x hash_groups x lanes) for ADD and ADDSLOW,
+    # or the groups for SWAP. Returns its sequence
+    def append(self, kind, wordidx, values):
+        wordidx = np.ascontiguousarray(wordidx, dtype='<i8')
+        if kind == self.SWAP:
+            values = np.ascontiguousarray(values, dtype='<i8')
+        else:
+            values = np.ascontiguousarray(values, dtype='<u8')
+        payload = wordidx.tobytes() + values.tobytes()
+        self.sequence += 1
+        self.file.write(self.RECORD.pack(self.sequence, kind, len(wordidx), zlib.crc32(payload)))
+        self.file.write(payload)
+        return self.sequence
+
+    # Make the records appended visible to the readers of the log
+    def flush(self):
+        self.file.flush()
+        return
+
+    # Iterate over the records after the sequence after, returning the
+    # sequence, the kind, the word indices and the masks or groups of each
+    # one. Reading stops at a record still being written. The offset where
+    # the last complete record read ends is left in end
+    def records(self, after=0):
+        with open(self.filename, 'rb') as f:
+            base, hash_groups, lanes = self.header(f)
+            if after < base:
+                raise ValueError("%s starts after sequence %d, load the snapshot first" % (self.filename, base))
+            self.end = f.tell()
+            while True:
+                data = f.read(self.RECORD.size)
+                if len(data) < self.RECORD.size:
+                    return
+                sequence, kind, count, crc = self.RECORD.unpack(data)
+                values = count if kind == self.SWAP else count*hash_groups*lanes
+                payload = f.read(8*(count + values))
+                if len(payload) < 8*(count + values) or zlib.crc32(payload) != crc:
+                    return
+                self.end = f.tell()
+                if sequence <= after:
+                    continue
+                wordidx = np.frombuffer(payload, dtype='<i8', count=count).astype(np.int64)
+                if kind == self.SWAP:
+                    values = np.frombuffer(payload, dtype='<i8', offset=8*count).astype(np.int64)
+                else:
+                    values = np.frombuffer(payload, dtype='<u8', offset=8*count).reshape(count, hash_groups, lanes)
+                yield sequence, kind, wordidx, values
+
+    # Apply the records after the sequence after to the filter abf.
+    # Returns the sequence of the last record applied
+    def replay(self, abf, after=0):
+        for sequence, kind, wordidx, values in self.records(after):
+            if kind == self.ADD:
+                abf.add_indices(wordidx, values)
+            elif kind == self.ADDSLOW:
+                abf.addslow_indices(wordidx, values)
+            elif kind == self.SWAP:
+                for w, g in zip(wordidx.tolist(), values.tolist()):
+                    abf.setword(w, abf.slow.getword(g, w))
+                    abf.setselector(w, g)
+            after = sequence
+        return after
+
+    # Bring the replica abf, which includes the changes up to the sequence
+    # after, up to date. If the log was compacted after that sequence, the
+    # replica is loaded from the snapshot first. Returns the replica and
+    # the sequence of its last change
+    def catchup(self, abf, after, snapshot, hash_f=None):
+        with open(self.filename, 'rb') as f:
+            base = self.header(f)[0]
+        if abf is None or after < base:
+            abf = snapshot.load(hash_f)
+            after = snapshot.sequence
+        return abf, self.replay(abf, after)
+
+    # Store the filter abf, which includes all the changes of the log, in
+    # the snapshot and start the log again after its last change
+    def compact(self, abf, snapshot):
+        self.file.close()
+        snapshot.save(abf, self.sequence)
+        self.reset(self.hash_groups, self.lanes, self.sequence)
+        self.base = self.sequence
+        self.file = open(self.filename, 'ab')
+        return
+
+    def close(self):
+        self.file.close()
+        return
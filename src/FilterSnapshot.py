@@ -0,0 +1,147 @@
+import os
+import mmap
+import struct
+import tempfile
+import zlib
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericHashFunctionsRegistry import buildHash
+
+# Binary snapshot on disk of the state of a filter: its geometry, the name
+# of its hash family and its packed structures (words, selectors and slow
+# memory, and the counters of a counting slow memory). The structures are stored in the layout used by
+# GenericAdaptiveBloomFilter.use_buffer after a page-aligned header, so a
+# snapshot is loaded by mapping the file into memory, without reading it.
+# The file is laid out as:
+#   header: magic, version, geometry, hash family, number of sections,
+#           sequence of the last change of the log included (version 2),
+#           flags (version 3), crc32
+#   section table: name, offset, length and crc32 of each structure
+#   padding up to DATA_OFFSET and the structures
+class FilterSnapshot:
+
+    MAGIC = b'ABFSNAP\0'
+    VERSION = 3
+    # magic, version, words, bits, nhash, hash_groups, backed, hash family, sections,
+    # from version 2, the sequence in the log (see FilterLog) of the last change included
+    # and, from version 3, the flags
+    HEADERS = {1: struct.Struct('<8sIQQQQQ16sI'), 2: struct.Struct('<8sIQQQQQ16sIQ'),
+               3: struct.Struct('<8sIQQQQQ16sIQI')}
+    HEADER = HEADERS[VERSION]
+    # flag of the filters with a counting slow memory, stored with their counters
+    COUNTING = 1
+    # name, offset from the start of the file, length and crc32 of a section
+    SECTION = struct.Struct('<4sQQI')
+    # the structures start at a page boundary
+    DATA_OFFSET = 4096
+
+    def __init__(self, filename):
+        # name of the snapshot file
+        self.filename = filename
+        # sequence of the last change of the log included in the snapshot
+        # saved or loaded
+        self.sequence = 0
+        return
+
+    # Check if the snapshot exists and is newer than the source file
+    def valid(self, source):
+        if not os.path.exists(self.filename):
+            return False
+        return os.path.getmtime(self.filename) >= os.path.getmtime(source)
+
+    # Store the state of the filter abf, which includes the changes of the
+    # log up to sequence. The snapshot is written to a temporary file of its
+    # own in the same directory and renamed, so an existing snapshot is
+    # never left half written, even if several processes save it at once
+    def save(self, abf, sequence=0):
+        words, selectors, slow = abf.buffer_sizes()
+        structures = [(b'WORD', memoryview(abf.bloom_structure).cast('B'), words),
+                      (b'SELE', memoryview(abf.selector_structure).cast('B'), selectors)]
+        if abf.backed:
+            structures.append((b'SLOW', memoryview(abf.slow.back_bloom).cast('B'), slow))
+        flags = 0
+        if getattr(abf, 'counting', False):
+            flags |= self.COUNTING
+            counters = memoryview(abf.slow.counters).cast('B')
+            # padded to 8 bytes, as the selectors
+            structures.append((b'CNTS', counters, (len(counters) + 7) // 8 * 8))
+
+        family = (getattr(abf.hash, 'name', None) or '').encode()
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, abf.words, abf.bits, abf.nhash, abf.hash_groups,
+                                  int(abf.backed), family, len(structures), sequence, flags)
+        offset = self.DATA_OFFSET
+        for name, data, length in structures:
+            # the checksum covers the padding of the section too
+            crc = zlib.crc32(bytes(length - len(data)), zlib.crc32(data))
+            header += self.SECTION.pack(name, offset, length, crc)
+            offset += length
+        # the checksum of the header closes it
+        header += struct.pack('<I', zlib.crc32(header))
+        assert len(header) <= self.DATA_OFFSET
+
+        directory, base = os.path.split(os.path.abspath(self.filename))
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", prefix=base + ".", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(bytes(self.DATA_OFFSET - len(header)))
+                for name, data, length in structures:
+                    f.write(data)
+                    # sections are padded to their length (the selectors to 8 bytes)
+                    f.write(bytes(length - len(data)))
+            os.replace(temporary, self.filename)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.sequence = sequence
+        return
+
+    # Read and check the header. Returns the geometry, the hash family,
+    # the list of sections, the sequence of the last change included and the flags
+    def header(self, mm):
+        magic, version = struct.unpack_from('<8sI', mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError("%s is not a filter snapshot" % self.filename)
+        if version not in self.HEADERS:
+            raise ValueError("%s has version %d, expected up to %d" % (self.filename, version, self.VERSION))
+        header = self.HEADERS[version]
+        fields = header.unpack_from(mm, 0)
+        count = fields[8]
+        sequence = fields[9] if version >= 2 else 0
+        flags = fields[10] if version >= 3 else 0
+        size = header.size + count*self.SECTION.size
+        if struct.unpack_from('<I', mm, size)[0] != zlib.crc32(mm[:size]):
+            raise ValueError("%s has a corrupted header" % self.filename)
+        sections = [self.SECTION.unpack_from(mm, header.size + i*self.SECTION.size) for i in range(count)]
+        return fields[2:8], sections, sequence, flags
+
+    # Load the filter stored in the snapshot, mapping the file into memory.
+    # Changes to the filter are private to the process and are not written
+    # to the file. The hash is built from the family name stored, unless
+    # hash_f is received. With verify, the checksums of the structures are checked
+    def load(self, hash_f=None, filter_class=GenericAdaptiveBloomFilter, verify=True):
+        with open(self.filename, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        (words, bits, nhash, hash_groups, backed, family), sections, self.sequence, flags = self.header(mm)
+        if verify:
+            for name, offset, length, crc in sections:
+                if zlib.crc32(memoryview(mm)[offset:offset+length]) != crc:
+                    raise ValueError("%s has a corrupted %s section" % (self.filename, name.decode()))
+        if hash_f is None:
+            hash_f = buildHash(family.rstrip(b'\0').decode(), words, bits, nhash, hash_groups)
+        # words padded to a power of 2 lanes come from an aligned filter
+        # (the structures start at a page boundary, so they stay aligned)
+        options = {}
+        if sections[0][2] > words * ((bits + 63) // 64) * 8:
+            options['aligned'] = True
+        if flags & self.COUNTING:
+            options['counting'] = True
+        # the filter is laid out over the mapped structures
+        abf = filter_class(words=words, bits=bits, nhash=nhash, hash_groups=hash_groups, backed=bool(backed),
+                           hash_f=hash_f, buffer=memoryview(mm)[self.DATA_OFFSET:], **options)
+        # the counters are kept in memory, so they are copied
+        for name, offset, length, crc in sections:
+            if name == b'CNTS':
+                counters = abf.slow.counters_view()
+                counters[:] = np.frombuffer(mm, dtype=np.uint8, count=len(counters), offset=offset)
+        return abf
@@ -1,23 +1,46 @@
-import hashlib
 import math
-import random
-import string
+from array import array
+import numpy as np
 from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
 from GenericSlowMemoryRepresentation import GenericSlowMemoryRepresentation
+from GenericSlowMemoryCounting import GenericSlowMemoryCounting
+from GenericBatchMethods import GenericBatchMethods
 
 # Adaptive bloom filter
-class GenericAdaptiveBloomFilter:
+class GenericAdaptiveBloomFilter(GenericBatchMethods):
 
-    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None):
+    # number of bits held by each machine integer (lane) of the packed structure
+    LANE_BITS = 64
+    LANE_MASK = (1 << LANE_BITS) - 1
+    # size in bytes of a cache line
+    CACHE_LINE = 64
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None, slow_file=None, buffer=None,
+                 counting=False, aligned=False):
         # number of blocks/words
         self.words = words
         # number of bits per block
         self.bits = bits
-        # the structure is stored as a flattened array
-        self.bloom_structure = [False] * (words * bits)
-        # the selector array with an integer per word to indicate
-        # the function being used
-        self.selector_structure = [0] * words
+        # number of 64-bit lanes needed to store a word. Words up to 64 bits
+        # (the usual case) are a single machine integer
+        self.lanes = (bits + self.LANE_BITS - 1) // self.LANE_BITS
+        # With aligned, the words are stored in blocks of a power of 2 lanes
+        # (up to a cache line for 512 bits) starting at a cache line boundary,
+        # so a word never spans two cache lines and a check reads a single one
+        self.aligned = aligned
+        if aligned:
+            self.lanes = 1 << math.ceil(math.log2(self.lanes))
+        # the selector array indicates the function group being used by each
+        # word. Selectors are bit-packed, each one using the smallest power
+        # of 2 bits (1, 2, 4, 8 or 16) that holds the group ids, so that
+        # a selector never spans two items of the array
+        self.selector_bits, self.selector_itemsize = self.selector_format(hash_groups)
+        self.selector_mask = (1 << self.selector_bits) - 1
+        self.selector_typecode = 'B' if self.selector_bits <= 8 else 'H'
+        # number of selectors per item of the array (a power of 2)
+        per_item = self.selector_itemsize * 8 // self.selector_bits
+        self.selector_shift = int(math.log2(per_item))
+        self.selector_items = (words + per_item - 1) // per_item
         # the hash class used to generate the functions
         if hash_f is None:
             self.hash = GenericHashFunctionsMD5(words, bits, nhash, hash_groups)
@@ -29,17 +52,38 @@ class GenericAdaptiveBloomFilter:
 
         self.hash_groups = hash_groups
         # the size of the word index
-        self.wordidx_size = int(math.log2(words))
+        self.wordidx_size = math.ceil(math.log2(words))
         # the size of each bit index to set/get a bit from the word
         self.bitidx_size = int(math.log2(bits))
+        self.backed = backed and hash_groups>1
+
+        # If buffer is set, the packed structures are laid out over it
+        # (see use_buffer) and take its contents
+        if buffer is not None:
+            structure, selector, slowbuf = self.layout(buffer)
+        else:
+            # the structure is stored as a packed array of unsigned 64-bit integers,
+            # with lanes consecutive integers per word. Bit i of a word is
+            # bit i%64 of its lane i//64
+            if aligned:
+                structure = self.aligned_structure(words * self.lanes)
+            else:
+                structure = array('Q', [0]) * (words * self.lanes)
+            selector = array(self.selector_typecode, [0]) * self.selector_items
+            slowbuf = None
+        self.bloom_structure = structure
+        self.selector_structure = selector
         # a simulation of the slow memory to swap the words
-        # only if the bloom filter is backed by this memory
-        if backed and hash_groups>1:
-            self.slow = GenericSlowMemoryRepresentation(words, bits, hash_groups)
-            self.backed=True
+        # only if the bloom filter is backed by this memory.
+        # If slow_file is set, the slow memory is mapped to that file.
+        # With counting, the slow memory keeps counters so that elements can be removed
+        self.counting = counting and self.backed
+        if self.counting:
+            self.slow = GenericSlowMemoryCounting(words, bits, hash_groups, slow_file, slowbuf)
+        elif self.backed:
+            self.slow = GenericSlowMemoryRepresentation(words, bits, hash_groups, slow_file, slowbuf)
         else:
             self.slow = None
-            self.backed = False
         return
 
     # Change the hash object that generates the function
@@ -47,71 +91,103 @@ class GenericAdaptiveBloomFilter:
         if hashObject is not None:
             self.hash = hashObject
         return
-        
+
+    # Retrieve the group of functions used by the wordidx-indexed word
+    def getselector(self, wordidx):
+        offset = (wordidx & ((1 << self.selector_shift) - 1)) * self.selector_bits
+        return (self.selector_structure[wordidx >> self.selector_shift] >> offset) & self.selector_mask
+
+    # Set the group of functions used by the wordidx-indexed word
+    def setselector(self, wordidx, group):
+        item = wordidx >> self.selector_shift
+        offset = (wordidx & ((1 << self.selector_shift) - 1)) * self.selector_bits
+        value = self.selector_structure[item] & ~(self.selector_mask << offset)
+        self.selector_structure[item] = value | (group << offset)
+        return
+
+    # Returns a zeroed structure of items unsigned 64-bit integers that
+    # starts at a cache line boundary, allocated as a NumPy buffer
+    def aligned_structure(self, items):
+        raw = np.zeros(items * 8 + self.CACHE_LINE, dtype=np.uint8)
+        offset = -raw.ctypes.data % self.CACHE_LINE
+        return memoryview(raw[offset:offset + items * 8]).cast('Q')
+
+    # Retrieve the wordidx-indexed word as a single integer
+    def getword(self, wordidx):
+        if self.lanes == 1:
+            return self.bloom_structure[wordidx]
+        # join the lanes of the word, the first one holding the lowest bits
+        wordinit = wordidx*self.lanes
+        word = 0
+        for j in range(self.lanes):
+            word |= self.bloom_structure[wordinit+j] << (j*self.LANE_BITS)
+        return word
+
+    # Replace the wordidx-indexed word by the integer word
+    def setword(self, wordidx, word):
+        if self.lanes == 1:
+            self.bloom_structure[wordidx] = word
+            return
+        # split the word into its lanes, the first one holding the lowest bits
+        wordinit = wordidx*self.lanes
+        for j in range(self.lanes):
+            self.bloom_structure[wordinit+j] = (word >> (j*self.LANE_BITS)) & self.LANE_MASK
+        return
+
     # method to add an element into the hash
     def add(self, data):
-        # retrieve the block index to select the word
-        wordidx = self.hash.getword_idx(data)
+        # retrieve the block index to select the word and the masks
+        # of the bits to be set for every group of functions
+        wordidx, masks = self.hash.indices(data)
 
-        # obtain the function group being used for that word
-        group_i = self.selector_structure[wordidx]
+        # select the mask of the function group being used for that word
+        mask = masks[self.getselector(wordidx)]
 
-        # extract a position from each hash to set the bit in the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function 
-            # the final position in the array is a combination
-            # of word index and bit index
-            bitidx = self.hash.getbit_idx(data, i, group_i) 
-            idx = int(wordidx*self.bits + bitidx)
-
-            # set the appropriate bit
-            self.bloom_structure[idx] = True
+        # set the appropriate bits with a single access to the word
+        if self.lanes == 1:
+            self.bloom_structure[wordidx] |= mask
+        else:
+            self.setword(wordidx, self.getword(wordidx) | mask)
 
         return
 
     def addslow(self, data):
         if not self.backed:
             return
-      # retrieve the block index to select the word
-        wordidx = self.hash.getword_idx(data)
+        # retrieve the block index to select the word and the masks
+        # of the bits to be set for every group of functions
+        wordidx, masks = self.hash.indices(data)
+
+        # Set all the bits in the slow memory for each group
+        for g in range(self.hash_groups):
+            self.slow.setbit(g, wordidx, masks[g])
+        return
 
-        # for each hash group we get the positions to be updated in the
-        # slow memory
-        idx_list = set()
+    # Remove data from the slow memory of every group and regenerate
+    # its word in the filter from the slow memory of the group in use.
+    # The data must have been added before, with add and addslow
+    def remove(self, data):
+        if not self.counting:
+            raise ValueError("Elements can only be removed from a filter with a counting slow memory")
+        wordidx, masks = self.hash.indices(data)
+        selector = self.getselector(wordidx)
         for g in range(self.hash_groups):
-            idx_list.clear()
-            # extract a position from each hash to set the bit in the selected word
-            for i in range(self.nhash):
-                # position for the ith hash of the group_i function 
-                # the final position in the array is a combination
-                # of word index and bit index
-                bitidx = self.hash.getbit_idx(data, i, g)
-                idx_list.add(bitidx)
-            # Set all the bits for this group
-            self.slow.setbit(g, wordidx, idx_list)    
+            word = self.slow.clearbit(g, wordidx, masks[g])
+            if g == selector:
+                self.setword(wordidx, word)
         return
-    
+
     # check the bloom filer for the specified data
     def check(self, data):
-        # retrieve the block index to select the word
-        wordidx = self.hash.getword_idx(data)
-
-        # obtain the function group being used for that word
-        group_i = self.selector_structure[wordidx]
-
-        # extract a position from each hash to get the bit from the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            bitidx = self.hash.getbit_idx(data, i, group_i)
-            idx = int(wordidx*self.bits + bitidx)
-
-            # check if the bit is set for the specified word
-            # if not, the data is not in the included
-            if not self.bloom_structure[idx]:
-                return False
-        return True
+        # retrieve the block index to select the word and the masks
+        # of the bits to be checked for every group of functions
+        wordidx, masks = self.hash.indices(data)
+
+        # select the mask of the function group being used for that word
+        mask = masks[self.getselector(wordidx)]
+
+        # the data is included only if all the bits of the mask are set
+        return (self.getword(wordidx) & mask) == mask
 
     # Swap the hashed word corresponding to data
     # by the word hashed by the alternative function.
@@ -119,20 +195,220 @@ class GenericAdaptiveBloomFilter:
     def swaphash(self, data):
         if not self.backed:
             return
-        # retrieve the block index to select the word
-        wordidx = self.hash.getword_idx(data)
+        # retrieve the block index to select the word and the masks
+        # of the bits checked by every group of functions
+        wordidx, masks = self.hash.indices(data)
+        return self.swapword(wordidx, masks)
 
+    # Swap the wordidx-indexed word by the word hashed by the alternative
+    # function. masks are the masks of the element that caused the swap
+    def swapword(self, wordidx, masks):
+        if not self.backed:
+            return
         # Getting the proper word from the slow memory
-        new_group = self.selector_structure[wordidx]+1
+        new_group = self.getselector(wordidx)+1
         if new_group==self.hash_groups:
             new_group = 0
         word = self.slow.getword(new_group, wordidx)
 
-        # calculate where the current word starts
-        wordinit = wordidx*self.bits
         # Replace the hashed word with the alternative hashed word
-        self.bloom_structure[wordinit:wordinit+self.bits] = word
+        self.setword(wordidx, word)
         # Update the selector to indicate that a new function is used
-        self.selector_structure[wordidx] = new_group
+        self.setselector(wordidx, new_group)
         return new_group
 
+    # Views of the packed structures as NumPy arrays sharing their memory
+    # (words x lanes for the bloom structure, and the packed selectors)
+    def words_view(self):
+        return np.frombuffer(self.bloom_structure, dtype=np.uint64).reshape(self.words, self.lanes)
+
+    def selector_view(self):
+        return np.frombuffer(self.selector_structure, dtype=self.selector_typecode)
+
+    # Vectorized version of getselector for an array of word indices
+    def selectors(self, wordidx):
+        items = self.selector_view()[wordidx >> self.selector_shift]
+        offsets = (wordidx & ((1 << self.selector_shift) - 1)) * self.selector_bits
+        return ((items >> offsets.astype(items.dtype)) & self.selector_mask).astype(np.intp)
+
+    # Returns the number of bits of each selector and the size in bytes of
+    # the items of the selector array for hash_groups groups of functions
+    @staticmethod
+    def selector_format(hash_groups):
+        assert hash_groups <= 65536
+        selector_bits = 1
+        while (1 << selector_bits) < hash_groups:
+            selector_bits *= 2
+        return selector_bits, 1 if selector_bits <= 8 else 2
+
+    # Returns the memory used by a filter of the given geometry, as
+    # memory_footprint would, without building the filter
+    @staticmethod
+    def geometry_footprint(words, bits, hash_groups, backed=True, aligned=False, counting=False):
+        lane_bits = GenericAdaptiveBloomFilter.LANE_BITS
+        lanes = (bits + lane_bits - 1) // lane_bits
+        # the words of the slow memory are never padded
+        slow = 0
+        if backed and hash_groups > 1:
+            slow = hash_groups * words * lanes * lane_bits // 8
+            if counting:
+                # 4-bit counters, two per byte (see GenericSlowMemoryCounting)
+                slow += (hash_groups * words * bits + 1) // 2
+        if aligned:
+            lanes = 1 << math.ceil(math.log2(lanes))
+        selector_bits, itemsize = GenericAdaptiveBloomFilter.selector_format(hash_groups)
+        per_item = itemsize * 8 // selector_bits
+        return {'words': words * lanes * lane_bits // 8,
+                'selectors': (words + per_item - 1) // per_item * itemsize,
+                'slow': slow}
+
+    # Returns the memory used in bytes by the words of the filter, by the
+    # selectors (the fast memory) and by the copies of the slow memory
+    def memory_footprint(self):
+        return {'words': memoryview(self.bloom_structure).nbytes,
+                'selectors': memoryview(self.selector_structure).nbytes,
+                'slow': self.slow.memory_footprint() if self.backed else 0}
+
+    # Number of bytes used by each of the packed structures when laid out
+    # in a single buffer: the words, the selectors (padded to a multiple
+    # of 8 bytes) and the slow memory, if backed. The words of the slow
+    # memory are never padded, even if those of the filter are aligned
+    # (see GenericSlowMemoryRepresentation.buffer_size)
+    def buffer_sizes(self):
+        words = self.words * self.lanes * self.LANE_BITS // 8
+        selectors = (self.selector_items * self.selector_itemsize + 7) // 8 * 8
+        slow_lanes = (self.bits + self.LANE_BITS - 1) // self.LANE_BITS
+        slow = self.hash_groups * self.words * slow_lanes * self.LANE_BITS // 8 if self.backed else 0
+        return words, selectors, slow
+
+    def buffer_size(self):
+        return sum(self.buffer_sizes())
+
+    # Lay out the packed structures over buf, a writable buffer of at least
+    # buffer_size() bytes (shared memory, a mapped file...), so that the
+    # filter works on it without copies. With copy, the current contents
+    # of the filter are copied to buf. Otherwise the filter takes the
+    # contents of buf
+    def use_buffer(self, buf, copy=True):
+        structure, selector, slowbuf = self.layout(buf)
+        if copy:
+            structure[:] = memoryview(self.bloom_structure)
+            selector[:] = memoryview(self.selector_structure)
+        self.bloom_structure = structure
+        self.selector_structure = selector
+        if self.backed:
+            self.slow.use_buffer(slowbuf, copy)
+        return
+
+    # Split buf in the views of the words, the selectors and the slow memory
+    def layout(self, buf):
+        mv = memoryview(buf).cast('B')
+        words, selectors, slow = self.buffer_sizes()
+        assert len(mv) >= words + selectors + slow
+        structure = mv[:words].cast('Q')
+        selector = mv[words:words+self.selector_items*self.selector_itemsize].cast(self.selector_typecode)
+        return structure, selector, mv[words+selectors:words+selectors+slow]
+
+    # add a batch of elements given by their word indices and masks
+    # (as returned by indices_many)
+    def add_indices(self, wordidx, masks):
+        # select the mask of the function group being used for each word
+        mask = masks[np.arange(len(wordidx)), self.selectors(wordidx)]
+        # set the bits. Elements mapped to the same word are all applied
+        words = self.words_view()
+        for j in range(self.lanes):
+            np.bitwise_or.at(words[:, j], wordidx, mask[:, j])
+        return
+
+    # add a batch of elements to the slow memory for all the groups,
+    # given by their word indices and masks
+    def addslow_indices(self, wordidx, masks):
+        if not self.backed:
+            return
+        self.slow.setbits_many(wordidx, masks)
+        return
+
+    # remove a batch of elements given by their word indices and masks
+    # (see remove)
+    def remove_indices(self, wordidx, masks):
+        if not self.counting:
+            raise ValueError("Elements can only be removed from a filter with a counting slow memory")
+        self.slow.clearbits_many(wordidx, masks)
+        # regenerate the words touched from the group in use
+        touched = np.unique(wordidx)
+        self.words_view()[touched, :self.slow.lanes] = self.slow.back_view()[self.selectors(touched), touched]
+        return
+
+    # check a batch of elements given by their word indices and masks.
+    # Returns a boolean array with the result for every element
+    def check_indices(self, wordidx, masks):
+        # select the mask of the function group being used for each word
+        mask = masks[np.arange(len(wordidx)), self.selectors(wordidx)]
+        # all the bits of the mask have to be set in the word
+        return ((self.words_view()[wordidx] & mask) == mask).all(axis=1)
+
+    # Join the lanes of a row of masks returned by indices_many into
+    # a tuple with an integer mask per group
+    def join_masks(self, masks):
+        return tuple(sum(int(masks[g, j]) << (j*self.LANE_BITS) for j in range(self.lanes))
+                     for g in range(self.hash_groups))
+
+    # check a batch of elements given by their word indices and masks,
+    # swapping the words as the sequential loop would do:
+    #   if check(element) and not member: fp+=1; if fp%swap==0: swaphash(element)
+    # members is a boolean array telling which elements were actually stored
+    # and fp the number of false positives found before this batch.
+    # Returns the results of every check and the updated number of false positives
+    def check_adapt_indices(self, wordidx, masks, members, swap=1, fp=0):
+        results = self.check_indices(wordidx, masks)
+        if not self.backed:
+            return results, fp + int(np.count_nonzero(results & ~members))
+
+        if swap == 1:
+            # Every false positive swaps its word, and a swap only changes the
+            # results of the later elements of the same word. So in each round
+            # the first false positive of every word can be swapped at once, and
+            # only the elements after it in that word need to be checked again
+            active = np.arange(len(wordidx))
+            while len(active):
+                falsepos = active[results[active] & ~members[active]]
+                if not len(falsepos):
+                    break
+                # first false positive of each word (falsepos is in order)
+                swapped, first = np.unique(wordidx[falsepos], return_index=True)
+                first = falsepos[first]
+                for t in first:
+                    self.swapword(int(wordidx[t]), self.join_masks(masks[t]))
+                # keep the elements of the swapped words after their first false positive
+                loc = np.searchsorted(swapped, wordidx[active])
+                found = loc < len(swapped)
+                loc[~found] = 0
+                found &= swapped[loc] == wordidx[active]
+                active = active[found & (active > first[loc])]
+                results[active] = self.check_indices(wordidx[active], masks[active])
+            return results, fp + int(np.count_nonzero(results & ~members))
+
+        # Otherwise the swaps depend on the global count of false positives,
+        # so they are applied one at a time in order
+        pos = 0
+        while True:
+            falsepos = np.flatnonzero(results[pos:] & ~members[pos:]) + pos
+            # false positives needed to trigger the next swap
+            needed = swap - fp % swap
+            if len(falsepos) < needed:
+                fp += len(falsepos)
+                break
+            t = falsepos[needed-1]
+            fp += needed
+            self.swapword(int(wordidx[t]), self.join_masks(masks[t]))
+            # check again the later elements mapped to the swapped word
+            later = np.flatnonzero(wordidx[t+1:] == wordidx[t]) + t + 1
+            results[later] = self.check_indices(wordidx[later], masks[later])
+            pos = t + 1
+        return results, fp
+
+    # remove all the elements of an iterable, hashing them in batches
+    def remove_many(self, elements):
+        for batch in self.batches(elements):
+            self.remove_indices(*self.hash.indices_many(batch, self.lanes))
+        return
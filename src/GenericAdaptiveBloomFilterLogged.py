@@ -0,0 +1,56 @@
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from FilterLog import FilterLog
+
+# Adaptive bloom filter that records every change of its words, selectors
+# and slow memory in a log (see FilterLog), so that replicas can replay them
+class GenericAdaptiveBloomFilterLogged(GenericAdaptiveBloomFilter):
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None, slow_file=None,
+                 log_file=None):
+        super().__init__(words, bits, nhash, hash_groups, backed, hash_f, slow_file)
+        # the log of the changes (opened or created for this geometry)
+        self.log = FilterLog(log_file, self)
+        return
+
+    def add(self, data):
+        wordidx, masks = self.hash.indices(data)
+        self.log.append(FilterLog.ADD, [wordidx], self.split_masks(masks))
+        super().add(data)
+        return
+
+    def addslow(self, data):
+        if not self.backed:
+            return
+        wordidx, masks = self.hash.indices(data)
+        self.log.append(FilterLog.ADDSLOW, [wordidx], self.split_masks(masks))
+        super().addslow(data)
+        return
+
+    def swapword(self, wordidx, masks):
+        if not self.backed:
+            return
+        new_group = super().swapword(wordidx, masks)
+        self.log.append(FilterLog.SWAP, [wordidx], [new_group])
+        return new_group
+
+    def add_indices(self, wordidx, masks):
+        self.log.append(FilterLog.ADD, wordidx, masks)
+        super().add_indices(wordidx, masks)
+        return
+
+    def addslow_indices(self, wordidx, masks):
+        if not self.backed:
+            return
+        self.log.append(FilterLog.ADDSLOW, wordidx, masks)
+        super().addslow_indices(wordidx, masks)
+        return
+
+    # Split the integer mask of each group in lanes, as returned by indices_many
+    def split_masks(self, masks):
+        return [[[(mask >> (j*self.LANE_BITS)) & self.LANE_MASK for j in range(self.lanes)] for mask in masks]]
+
+    # Store the filter in the snapshot and compact the log
+    def compact(self, snapshot):
+        self.log.flush()
+        self.log.compact(self, snapshot)
+        return
@@ -0,0 +1,215 @@
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericBatchMethods import GenericBatchMethods
+from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+
+# Adaptive bloom filter that can double its number of words while it is
+# being used. resize() grows the hash, so that the elements of word w are
+# mapped to words 2w and 2w+1 with the same bit indices, and creates a
+# filter with twice the words. The words (with their selectors and their
+# copies in the slow memory) are then migrated in chunks of at most
+# chunk words per element added or adapted, or with migrate().
+# A migrated word is copied to both of its new words, as the elements it
+# holds are not known, so the filter never gives false negatives. The
+# elements added after the resize are spread over twice the words.
+# Until a word is migrated, the operations on it use the old filter (with
+# the word index halved), and the new filter afterwards
+class GenericAdaptiveBloomFilterResizable(GenericBatchMethods):
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None, chunk=64,
+                 filter_class=GenericAdaptiveBloomFilter):
+        self.bits = bits
+        self.nhash = nhash
+        self.hash_groups = hash_groups
+        self.backed = backed
+        self.filter_class = filter_class
+        # maximum number of words migrated per element
+        self.chunk = chunk
+        # the hash class used to generate the functions, shared by the filters
+        if hash_f is None:
+            self.hash = GenericHashFunctionsMD5(words, bits, nhash, hash_groups)
+        else:
+            self.hash = hash_f
+        # the filter in use and, while resizing, the filter with twice the
+        # words the old words are migrated to
+        self.filter = filter_class(words=words, bits=bits, nhash=nhash, hash_groups=hash_groups,
+                                   backed=backed, hash_f=self.hash)
+        self.next = None
+        # number of words of the filter already migrated
+        self.migrated = 0
+        self.lanes = self.filter.lanes
+        return
+
+    # number of words indexed by the hash
+    @property
+    def words(self):
+        return self.filter.words if self.next is None else self.next.words
+
+    def resizing(self):
+        return self.next is not None
+
+    # Start doubling the number of words. A resize in progress is finished first
+    def resize(self):
+        if self.next is not None:
+            self.migrate(self.filter.words)
+        self.hash.grow()
+        self.next = self.filter_class(words=self.filter.words*2, bits=self.bits, nhash=self.nhash,
+                                      hash_groups=self.hash_groups, backed=self.backed, hash_f=self.hash)
+        self.migrated = 0
+        return
+
+    # Migrate the next count words (all the remaining ones if None).
+    # Returns True when the resize is complete
+    def migrate(self, count=None):
+        if self.next is None:
+            return True
+        old = self.filter
+        start = self.migrated
+        end = old.words if count is None else min(old.words, start + count)
+        if end > start:
+            # each word is copied to the two words its elements are mapped to
+            words = old.words_view()[start:end]
+            self.next.words_view()[2*start:2*end:2] = words
+            self.next.words_view()[2*start+1:2*end:2] = words
+            selectors = old.selectors(np.arange(start, end))
+            for w in np.flatnonzero(selectors).tolist():
+                self.next.setselector(2*(start+w), int(selectors[w]))
+                self.next.setselector(2*(start+w)+1, int(selectors[w]))
+            if old.backed:
+                back = old.slow.back_view()[:, start:end]
+                self.next.slow.back_view()[:, 2*start:2*end:2] = back
+                self.next.slow.back_view()[:, 2*start+1:2*end:2] = back
+            self.migrated = end
+        if self.migrated < old.words:
+            return False
+        # the new filter replaces the old one
+        if old.backed:
+            old.slow.close()
+        self.filter = self.next
+        self.next = None
+        self.migrated = 0
+        return True
+
+    # Returns the filter holding the word wordidx (as indexed by the hash)
+    # and the index of the word in it
+    def route(self, wordidx):
+        if self.next is None:
+            return self.filter, wordidx
+        if (wordidx >> 1) < self.migrated:
+            return self.next, wordidx
+        return self.filter, wordidx >> 1
+
+    # Vectorized version of route. Returns a boolean array telling which
+    # word indices are in the new filter and the index of each word in its filter
+    def route_many(self, wordidx):
+        wordidx = np.asarray(wordidx, dtype=np.int64)
+        if self.next is None:
+            return np.zeros(len(wordidx), dtype=bool), wordidx
+        migrated = (wordidx >> 1) < self.migrated
+        return migrated, np.where(migrated, wordidx, wordidx >> 1)
+
+    # Migrate a chunk of words for each of the elements of an operation
+    def step(self, elements=1):
+        if self.next is not None:
+            self.migrate(self.chunk * elements)
+        return
+
+    def add(self, data):
+        self.step()
+        wordidx, masks = self.hash.indices(data)
+        abf, wordidx = self.route(wordidx)
+        mask = masks[abf.getselector(wordidx)]
+        abf.setword(wordidx, abf.getword(wordidx) | mask)
+        return
+
+    def addslow(self, data):
+        if not self.filter.backed:
+            return
+        self.step()
+        wordidx, masks = self.hash.indices(data)
+        abf, wordidx = self.route(wordidx)
+        for g in range(self.hash_groups):
+            abf.slow.setbit(g, wordidx, masks[g])
+        return
+
+    def check(self, data):
+        wordidx, masks = self.hash.indices(data)
+        abf, wordidx = self.route(wordidx)
+        mask = masks[abf.getselector(wordidx)]
+        return (abf.getword(wordidx) & mask) == mask
+
+    def swaphash(self, data):
+        if not self.filter.backed:
+            return
+        self.step()
+        wordidx, masks = self.hash.indices(data)
+        abf, wordidx = self.route(wordidx)
+        return abf.swapword(wordidx, masks)
+
+    def swapword(self, wordidx, masks):
+        abf, wordidx = self.route(wordidx)
+        return abf.swapword(wordidx, masks)
+
+    # Batch methods over word indices and masks (as returned by indices_many),
+    # split between the old and the new filter
+    def add_indices(self, wordidx, masks):
+        self.step(len(wordidx))
+        migrated, local = self.route_many(wordidx)
+        if migrated.any():
+            self.next.add_indices(local[migrated], masks[migrated])
+        self.filter.add_indices(local[~migrated], masks[~migrated])
+        return
+
+    def addslow_indices(self, wordidx, masks):
+        self.step(len(wordidx))
+        migrated, local = self.route_many(wordidx)
+        if migrated.any():
+            self.next.addslow_indices(local[migrated], masks[migrated])
+        self.filter.addslow_indices(local[~migrated], masks[~migrated])
+        return
+
+    def check_indices(self, wordidx, masks):
+        migrated, local = self.route_many(wordidx)
+        results = np.zeros(len(local), dtype=bool)
+        if migrated.any():
+            results[migrated] = self.next.check_indices(local[migrated], masks[migrated])
+        results[~migrated] = self.filter.check_indices(local[~migrated], masks[~migrated])
+        return results
+
+    # check a batch of elements swapping the words on false positives
+    # (see GenericAdaptiveBloomFilter.check_adapt_indices)
+    def check_adapt_indices(self, wordidx, masks, members, swap=1, fp=0):
+        self.step(len(wordidx))
+        if self.next is None:
+            return self.filter.check_adapt_indices(wordidx, masks, members, swap, fp)
+        members = np.asarray(members, dtype=bool)
+        migrated, local = self.route_many(wordidx)
+        if swap == 1:
+            # a swap only changes the results of the same word, and the
+            # words of both filters are different, so each filter can
+            # adapt its own elements
+            results = np.zeros(len(local), dtype=bool)
+            results[migrated], fp = self.next.check_adapt_indices(local[migrated], masks[migrated],
+                                                                  members[migrated], swap, fp)
+            results[~migrated], fp = self.filter.check_adapt_indices(local[~migrated], masks[~migrated],
+                                                                     members[~migrated], swap, fp)
+            return results, fp
+        # Otherwise the swaps depend on the global count of false positives,
+        # so the elements are checked one at a time in order
+        results = np.zeros(len(local), dtype=bool)
+        for t in range(len(local)):
+            abf = self.next if migrated[t] else self.filter
+            results[t] = abf.check_indices(local[t:t+1], masks[t:t+1])[0]
+            if results[t] and not members[t]:
+                fp += 1
+                if fp % swap == 0:
+                    abf.swapword(int(local[t]), abf.join_masks(masks[t]))
+        return results, fp
+
+    # Returns the memory used by the filters (both of them while resizing)
+    def memory_footprint(self):
+        footprint = self.filter.memory_footprint()
+        if self.next is not None:
+            for name, size in self.next.memory_footprint().items():
+                footprint[name] += size
+        return footprint
@@ -0,0 +1,166 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericBatchMethods import GenericBatchMethods
+from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+
+# Adaptive bloom filter partitioned in shards by ranges of the word
+# index. Each shard holds a contiguous range of words (with their selectors
+# and slow memory words) in shared memory and is served by its own worker
+# process, the only one that modifies it. The router hashes every batch
+# once and dispatches to each shard the word indices and masks of its
+# elements, so that the shards are queried in parallel.
+# An element only touches the words of its shard, so the results are the
+# ones of a single filter. The only exception is check_adapt_indices with
+# swap>1: each shard counts its own false positives to trigger the swaps
+class GenericAdaptiveBloomFilterSharded(GenericBatchMethods):
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None, shards=4,
+                 filter_class=GenericAdaptiveBloomFilter):
+        # the number of shards must be no larger than words
+        assert 0 < shards <= words
+        self.words = words
+        self.bits = bits
+        self.nhash = nhash
+        self.hash_groups = hash_groups
+        self.shards = shards
+        # each shard holds a contiguous range of shard_words words (the
+        # last one may not use all of them)
+        self.shard_words = (words + shards - 1) // shards
+        # the hash class used by the router to generate the functions
+        # over the whole word space
+        if hash_f is None:
+            self.hash = GenericHashFunctionsMD5(words, bits, nhash, hash_groups)
+        else:
+            self.hash = hash_f
+        # false positives found by each shard, as counted by its worker
+        self.fp = [0] * shards
+
+        # the shards, their shared memory and their workers
+        self.filters = []
+        self.memory = []
+        self.tasks = []
+        self.results = []
+        self.workers = []
+        for s in range(shards):
+            abf = filter_class(words=self.shard_words, bits=bits, nhash=nhash, hash_groups=hash_groups,
+                               backed=backed, hash_f=self.hash)
+            shm = shared_memory.SharedMemory(create=True, size=abf.buffer_size())
+            abf.use_buffer(shm.buf, copy=False)
+            tasks = multiprocessing.Queue()
+            results = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=shardWorker, daemon=True,
+                                             args=(shm.name, self.shard_words, bits, nhash, hash_groups,
+                                                   backed, self.hash, filter_class, tasks, results))
+            worker.start()
+            self.filters.append(abf)
+            self.memory.append(shm)
+            self.tasks.append(tasks)
+            self.results.append(results)
+            self.workers.append(worker)
+        self.lanes = self.filters[0].lanes
+        self.backed = self.filters[0].backed
+        return
+
+    # Returns the shard of each word index and the word index within it
+    def route(self, wordidx):
+        shard = wordidx // self.shard_words
+        return shard, wordidx - shard * self.shard_words
+
+    # Send the operation for a batch of word indices and masks (and members,
+    # if any) to the shards and wait for them. Returns the list of the
+    # results of every shard, along with the positions of its elements
+    # in the batch
+    def dispatch(self, operation, wordidx, masks, members=None, *args):
+        shard, local = self.route(np.asarray(wordidx, dtype=np.int64))
+        positions = [np.flatnonzero(shard == s) for s in range(self.shards)]
+        busy = [s for s in range(self.shards) if len(positions[s])]
+        for s in busy:
+            p = positions[s]
+            self.tasks[s].put((operation, local[p], masks[p], None if members is None else members[p], args))
+        # every busy shard is waited for before raising an error, so that
+        # no reply is left to be read by the next operation
+        results = [(s, positions[s], self.results[s].get()) for s in busy]
+        for s, p, result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    # add a batch of elements given by their word indices and masks
+    # (as returned by indices_many)
+    def add_indices(self, wordidx, masks):
+        self.dispatch('add', wordidx, masks)
+        return
+
+    # add a batch of elements to the slow memory for all the groups
+    def addslow_indices(self, wordidx, masks):
+        self.dispatch('addslow', wordidx, masks)
+        return
+
+    # check a batch of elements. Returns a boolean array with the result
+    # for every element
+    def check_indices(self, wordidx, masks):
+        results = np.zeros(len(wordidx), dtype=bool)
+        for s, positions, result in self.dispatch('check', wordidx, masks):
+            results[positions] = result
+        return results
+
+    # check a batch of elements swapping the words on false positives
+    # (see GenericAdaptiveBloomFilter.check_adapt_indices).
+    # Returns the results of every check and the updated number of false positives
+    def check_adapt_indices(self, wordidx, masks, members, swap=1, fp=0):
+        results = np.zeros(len(wordidx), dtype=bool)
+        members = np.asarray(members, dtype=bool)
+        for s, positions, (result, shardfp) in self.dispatch('check_adapt', wordidx, masks, members, swap):
+            results[positions] = result
+            fp += shardfp - self.fp[s]
+            self.fp[s] = shardfp
+        return results, fp
+
+    # Stop the workers and release the shared memory
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        # the shard filters reference the shared memory, drop them first
+        self.filters = []
+        for shm in self.memory:
+            shm.close()
+            shm.unlink()
+        self.memory = []
+        return
+
+# Loop of the worker process of a shard. Attaches to the shared memory of
+# the shard and runs the operations received until None is received
+def shardWorker(name, words, bits, nhash, hash_groups, backed, hash_f, filter_class, tasks, results):
+    shm = shared_memory.SharedMemory(name=name)
+    # the shard only receives word indices and masks, so it does not hash
+    abf = filter_class(words=words, bits=bits, nhash=nhash, hash_groups=hash_groups,
+                       backed=backed, hash_f=hash_f, buffer=shm.buf)
+    # false positives found by the shard
+    fp = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        operation, wordidx, masks, members, args = task
+        try:
+            if operation == 'add':
+                result = abf.add_indices(wordidx, masks)
+            elif operation == 'addslow':
+                result = abf.addslow_indices(wordidx, masks)
+            elif operation == 'check':
+                result = abf.check_indices(wordidx, masks)
+            elif operation == 'check_adapt':
+                result, fp = abf.check_adapt_indices(wordidx, masks, members, args[0], fp)
+                result = (result, fp)
+            else:
+                raise ValueError("Unknown operation %s" % operation)
+        except Exception as e:
+            result = e
+        results.put(result)
+    del abf
+    shm.close()
+    return
@@ -0,0 +1,130 @@
+import struct
+from multiprocessing import shared_memory
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericHashFunctionsRegistry import buildHash
+
+# Adaptive bloom filter whose packed structures (words, selectors and slow
+# memory) are placed in a block of shared memory, so that many processes
+# can read a filter built by a single writer without copying it.
+# The block starts with a header with the geometry of the filter and the
+# name of its hash family, followed by a sequence number per word and the
+# packed structures (see GenericAdaptiveBloomFilter.use_buffer).
+# The writer updates each word and its selector inside a seqlock: the
+# sequence of the word is odd while it is being modified, and readers
+# retry the reads that overlap a modification. So readers always see a
+# word and its selector as they were before or after a change, never
+# half written. It relies on the stores being seen in order by other
+# processes, as they are in x86 processors
+class GenericAdaptiveBloomFilterShared(GenericAdaptiveBloomFilter):
+
+    # header: magic, words, bits, nhash, hash_groups, backed, hash family name
+    MAGIC = b'ABFSHM01'
+    HEADER = struct.Struct('<8sQQQQQ16s')
+
+    # With shm, the filter is attached (read only) to an existing shared memory block.
+    # Otherwise a new block is created with the name received (a random one if None)
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, backed=True, hash_f=None, name=None, shm=None):
+        sequences = words * 8
+        # the writer owns the shared memory and removes it when closed
+        self.owner = shm is None
+        if self.owner:
+            super().__init__(words, bits, nhash, hash_groups, backed, hash_f)
+            size = self.HEADER.size + sequences + self.buffer_size()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            buf = self.shm.buf
+            self.HEADER.pack_into(buf, 0, self.MAGIC, words, bits, nhash, hash_groups, int(self.backed),
+                                  (getattr(self.hash, 'name', None) or '').encode())
+        else:
+            self.shm = shm
+            buf = shm.buf.toreadonly()
+        self.name = self.shm.name
+        mv = memoryview(buf).cast('B')
+        self.sequence = mv[self.HEADER.size:self.HEADER.size+sequences].cast('Q')
+        if self.owner:
+            # move the (empty) structures to the shared memory
+            self.use_buffer(mv[self.HEADER.size+sequences:])
+        else:
+            # readers take the structures in the shared memory as they are
+            super().__init__(words, bits, nhash, hash_groups, backed, hash_f, buffer=mv[self.HEADER.size+sequences:])
+        return
+
+    # View of the sequences as a NumPy array sharing their memory
+    def sequence_view(self):
+        return np.frombuffer(self.sequence, dtype=np.uint64)
+
+    # Methods of the writer, modifying the words inside the seqlock
+    def add(self, data):
+        wordidx = self.hash.getword_idx(data)
+        self.sequence[wordidx] += 1
+        super().add(data)
+        self.sequence[wordidx] += 1
+        return
+
+    def add_indices(self, wordidx, masks):
+        sequence = self.sequence_view()
+        touched = np.unique(wordidx)
+        sequence[touched] += 1
+        super().add_indices(wordidx, masks)
+        sequence[touched] += 1
+        return
+
+    def swapword(self, wordidx, masks):
+        if not self.backed:
+            return
+        self.sequence[wordidx] += 1
+        new_group = super().swapword(wordidx, masks)
+        self.sequence[wordidx] += 1
+        return new_group
+
+    # check the filter for the specified data, reading the word and its
+    # selector again if they were modified meanwhile
+    def check(self, data):
+        wordidx, masks = self.hash.indices(data)
+        while True:
+            sequence = self.sequence[wordidx]
+            if sequence & 1:
+                continue
+            mask = masks[self.getselector(wordidx)]
+            word = self.getword(wordidx)
+            if self.sequence[wordidx] == sequence:
+                return (word & mask) == mask
+
+    # check a batch of elements, checking again those whose words
+    # were modified meanwhile
+    def check_indices(self, wordidx, masks):
+        sequence = self.sequence_view()
+        results = np.zeros(len(wordidx), dtype=bool)
+        pending = np.arange(len(wordidx))
+        while len(pending):
+            before = sequence[wordidx[pending]]
+            results[pending] = super().check_indices(wordidx[pending], masks[pending])
+            after = sequence[wordidx[pending]]
+            pending = pending[(before != after) | (before & np.uint64(1)).astype(bool)]
+        return results
+
+    # Detach from the shared memory. The writer also removes it
+    def close(self):
+        # views of the shared memory must be released before closing it
+        self.sequence.release()
+        self.bloom_structure.release()
+        self.selector_structure.release()
+        if self.backed:
+            self.slow.back_bloom.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        return
+
+# Attach a reader to the filter in the shared memory block name, without
+# copying it. The hash is built from the family name stored in the header,
+# unless hash_f is received
+def attachFilter(name, hash_f=None):
+    shm = shared_memory.SharedMemory(name=name)
+    magic, words, bits, nhash, hash_groups, backed, family = GenericAdaptiveBloomFilterShared.HEADER.unpack_from(shm.buf, 0)
+    if magic != GenericAdaptiveBloomFilterShared.MAGIC:
+        shm.close()
+        raise ValueError("%s is not a shared filter" % name)
+    if hash_f is None:
+        hash_f = buildHash(family.rstrip(b'\0').decode(), words, bits, nhash, hash_groups)
+    return GenericAdaptiveBloomFilterShared(words, bits, nhash, hash_groups, bool(backed), hash_f, name, shm)
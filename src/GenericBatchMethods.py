@@ -0,0 +1,58 @@
+import itertools
+import numpy as np
+
+# Batch methods over iterables of elements, shared by the filters. The
+# elements are hashed in batches of BATCH_SIZE with hash.indices_many and
+# passed to the methods over word indices and masks of the class
+# (add_indices, addslow_indices, check_indices and check_adapt_indices).
+# The class also provides hash, lanes and backed
+class GenericBatchMethods:
+
+    # number of elements hashed together by the batch methods
+    BATCH_SIZE = 65536
+
+    # Split an iterable of elements in lists of BATCH_SIZE elements
+    def batches(self, elements):
+        iterator = iter(elements)
+        while True:
+            batch = list(itertools.islice(iterator, self.BATCH_SIZE))
+            if not batch:
+                return
+            yield batch
+
+    # check a list of elements adapting the filter as the sequential loop
+    # would do (see GenericAdaptiveBloomFilter.check_adapt_indices)
+    def check_adapt_many(self, elements, members, swap=1, fp=0):
+        members = np.asarray(members, dtype=bool)
+        results = []
+        start = 0
+        for batch in self.batches(elements):
+            wordidx, masks = self.hash.indices_many(batch, self.lanes)
+            result, fp = self.check_adapt_indices(wordidx, masks, members[start:start+len(batch)], swap, fp)
+            results.append(result)
+            start += len(batch)
+        if not results:
+            return np.zeros(0, dtype=bool), fp
+        return np.concatenate(results), fp
+
+    # add all the elements of an iterable, hashing them in batches
+    def add_many(self, elements):
+        for batch in self.batches(elements):
+            self.add_indices(*self.hash.indices_many(batch, self.lanes))
+        return
+
+    # add all the elements of an iterable to the slow memory
+    def addslow_many(self, elements):
+        if not self.backed:
+            return
+        for batch in self.batches(elements):
+            self.addslow_indices(*self.hash.indices_many(batch, self.lanes))
+        return
+
+    # check all the elements of an iterable. Returns a boolean array
+    # with the result for every element
+    def check_many(self, elements):
+        results = [self.check_indices(*self.hash.indices_many(batch, self.lanes)) for batch in self.batches(elements)]
+        if not results:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate(results)
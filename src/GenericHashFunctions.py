@@ -0,0 +1,295 @@
+import math
+from collections import OrderedDict
+import numpy as np
+
+# Base class for the hash classes that build all the functions from a
+# single digest of the element. The digest is kept as an integer and
+# the indices are extracted with shifts and masks, reading it from its
+# most significant bit as a binary string would be read
+class GenericHashFunctions:
+
+    # name of the hash family in the registry
+    name = None
+    # extra bits of the word index field used when words is not a power of 2
+    REDUCE_BITS = 16
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, hash=None, digest_bits=128, cache_size=1024):
+        # the underlying hash function to be used. Its result is split
+        # in a way the subsets are used for all the hash functions
+        self.hash = hash
+        # the number of bits provided by the hash function
+        self.digest_bits = digest_bits
+
+        # the number of total hash groups (f, g ...)
+        self.hash_groups = hash_groups
+        # the number of hashes per group, apart from the word hash function
+        self.nhash = nhash
+        # the size of each bit index to set/get a bit from the word
+        self.bitidx_size = int(math.log2(bits))
+        # number of blocks/words. It does not need to be a power of 2
+        self.words = words
+        # the number of bits of the largest word index
+        self.words_size = math.ceil(math.log2(words))
+        # the size of the word index field. When words is not a power of 2,
+        # the field is reduced to the range of words (see reduce_wordidx).
+        # The field then takes up to REDUCE_BITS more bits of the digest, if
+        # available, so that all the words are selected with almost the same
+        # probability
+        self.wordidx_size = self.words_size
+        self.reduce_words = words != (1 << self.words_size)
+        if self.reduce_words:
+            spare = digest_bits - (hash_groups*nhash*self.bitidx_size + self.wordidx_size)
+            self.wordidx_size += max(0, min(self.REDUCE_BITS, spare))
+        # when set, bit indices are scaled to this word width (see convert_bitidx)
+        self.scale_bits = None
+        # number of times the filter doubled its words (see grow)
+        self.grow_bits = 0
+        # keep the digests of the last cache_size elements (least recently
+        # used first) to avoid hash recalculation. 0 disables the cache
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # number of digests found in the cache and calculated
+        self.hits = 0
+        self.misses = 0
+
+        # The digest provides digest_bits bits. With those bits we have to build:
+        #   * The hash function to select the word
+        #   * The nhash functions (g) to select the bits to be set/retrieved
+        #   * Other (hash_groups-1)*nhash functions (f), alternative to the previous ones.
+        #  hash = [word index][g bit index 1]...[g bit index nhash][f bit index 1]...[f bit index nhash]
+        assert digest_bits >= (hash_groups*nhash*self.bitidx_size + self.wordidx_size)
+        return
+
+    # Returns the digest of the element as an integer, the first bit
+    # of the digest being the most significant one
+    def digest(self, element):
+        # Elements can be received as strings or as raw bytes
+        key = element.encode() if isinstance(element, str) else element
+        cache = self.cache
+        value = cache.get(key)
+        if value is not None:
+            self.hits += 1
+            cache.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self.compute(key)
+        # Cache the hashed value, discarding the least recently used one
+        if self.cache_size > 0:
+            cache[key] = value
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    # Calculates the digest of a key (bytes) as an integer
+    def compute(self, key):
+        return int.from_bytes(self.digest_bytes(key), 'big')
+
+    # Returns the digest of a key (bytes) as bytes
+    def digest_bytes(self, key):
+        return self.hash(key).digest()
+
+    # Returns the hits, misses, current size and maximum size of the digest cache
+    def cache_info(self):
+        return self.hits, self.misses, len(self.cache), self.cache_size
+
+    # Empties the digest cache and resets its counters
+    def cache_clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    # Double the number of words indexed. The word index gets as its lowest
+    # bit one more bit of the digest, taken after the bit indices, so the
+    # elements of word w go to words 2w and 2w+1 with the same bit indices
+    def grow(self):
+        if self.fields_size() + self.grow_bits + 1 > self.digest_bits:
+            raise ValueError("The digest has no bits left to grow the word index")
+        self.grow_bits += 1
+        return
+
+    # Number of bits of the digest used by the word index and the bit indices
+    def fields_size(self):
+        return self.wordidx_size + self.hash_groups*self.nhash*self.bitidx_size
+
+    # Maps a word index field of wordidx_size bits to the range [0, words)
+    # with a multiply and a shift, (field*words) >> wordidx_size, instead
+    # of a modulo. For a power of 2 words the field is left as is
+    def reduce_wordidx(self, field):
+        if self.reduce_words:
+            return field * self.words >> self.wordidx_size
+        return field
+
+    # Vectorized version of reduce_wordidx for an array of fields
+    def reduce_wordidx_many(self, field):
+        if self.reduce_words:
+            return field * np.uint64(self.words) >> np.uint64(self.wordidx_size)
+        return field
+
+    # Adds to the word index extracted from the digest h the bits added by grow
+    def grown_wordidx(self, h, wordidx):
+        end = self.digest_bits - self.fields_size() - self.grow_bits
+        return (wordidx << self.grow_bits) | ((h >> end) & ((1 << self.grow_bits) - 1))
+
+    # Retrieves the word index (the appropriate block) for the element
+    def getword_idx(self, element):
+        # Calculate the word index using the first wordidx_size bits from the hash.
+        h = self.digest(element)
+        wordidx = self.reduce_wordidx(h >> (self.digest_bits - self.wordidx_size))
+        if self.grow_bits:
+            wordidx = self.grown_wordidx(h, wordidx)
+        return wordidx
+
+    # Retrieves the bit index using the nth hash from group for the element
+    def getbit_idx(self, element, n, group):
+        assert group < self.hash_groups
+        # Due to how the hash is reused, indices for the functions of group i
+        # start at the end of the function from i-1. So the code is the
+        # same, but skipping the n*(i-1) indices
+        n = group*self.nhash + n
+
+        # Calculate the bit index selecting the start position by skipping
+        # the word index and the previous n-1 bit indices. The bit index
+        # includes the bitidx_size bits following that position
+        end = self.wordidx_size + self.bitidx_size*(n+1)
+        return (self.digest(element) >> (self.digest_bits - end)) & ((1 << self.bitidx_size) - 1)
+
+    # Retrieves, with a single hash calculation, the word index of the element
+    # and a tuple with the mask of the nhash bits selected by each group
+    def indices(self, element):
+        h = self.digest(element)
+        # position of the end of the field being extracted, counted
+        # from the least significant bit of the digest
+        end = self.digest_bits - self.wordidx_size
+        wordidx = self.reduce_wordidx(h >> end)
+        bitidx_mask = (1 << self.bitidx_size) - 1
+        masks = []
+        for g in range(self.hash_groups):
+            mask = 0
+            for n in range(self.nhash):
+                end -= self.bitidx_size
+                bitidx = (h >> end) & bitidx_mask
+                if self.scale_bits is not None:
+                    bitidx = bitidx * self.scale_bits >> self.bitidx_size
+                mask |= 1 << bitidx
+            masks.append(mask)
+        if self.grow_bits:
+            wordidx = self.grown_wordidx(h, wordidx)
+        return wordidx, tuple(masks)
+
+    # Returns the digests of a batch of elements as an array of unsigned
+    # 64-bit integers with a row per element. The first column holds the
+    # first (most significant) 64 bits of the digest, and so on
+    def digests_many(self, elements):
+        digest_bytes = self.digest_bytes
+        raw = b"".join(digest_bytes(e.encode() if isinstance(e, str) else e) for e in elements)
+        # pad every digest to a multiple of 64 bits with zeros at the end
+        size = (self.digest_bits + 7) // 8
+        padded = (size + 7) // 8 * 8
+        digests = np.frombuffer(raw, dtype=np.uint8).reshape(-1, size)
+        if padded != size:
+            digests = np.hstack((digests, np.zeros((len(digests), padded - size), dtype=np.uint8)))
+        # interpret each group of 8 bytes as a big endian integer
+        return np.ascontiguousarray(digests).view('>u8').astype(np.uint64)
+
+    # Extracts from every row of digests the size bits starting at bit
+    # start, counting from the most significant bit of the digest
+    @staticmethod
+    def extract_field(digests, start, size):
+        if size == 0:
+            return np.zeros(len(digests), dtype=np.uint64)
+        col, off = divmod(start, 64)
+        end = off + size
+        if end <= 64:
+            value = digests[:, col] >> np.uint64(64 - end)
+        else:
+            # the field spans two columns
+            value = (digests[:, col] << np.uint64(end - 64)) | (digests[:, col+1] >> np.uint64(128 - end))
+        return value & np.uint64((1 << size) - 1)
+
+    # Vectorized version of indices for a batch of elements. Returns an array
+    # with the word index of each element and an array of shape
+    # (elements, hash_groups, lanes) with the masks of every group split
+    # in 64-bit lanes
+    def indices_many(self, elements, lanes=1):
+        if not isinstance(elements, list):
+            elements = list(elements)
+        # the fields are extracted with 64-bit arithmetic. Bit indices whose
+        # scaling does not fit in 64 bits are scaled in parts (see
+        # scaled_bitidx_many). Otherwise fall back to the scalar extraction
+        scale_size = 0 if self.scale_bits is None else math.ceil(math.log2(self.scale_bits))
+        wide = self.bitidx_size + scale_size > 64
+        # (the reduction of the word index multiplies it by words)
+        wordidx_size = self.wordidx_size + self.words_size if self.reduce_words else self.wordidx_size
+        if wordidx_size > 64 or self.wordidx_size + self.grow_bits > 64 or \
+                (wide and (self.scale_bits is None or max(0, self.bitidx_size - 64) + scale_size > 63)):
+            return self.indices_scalar(elements, lanes)
+
+        digests = self.digests_many(elements)
+        wordidx = self.reduce_wordidx_many(self.extract_field(digests, 0, self.wordidx_size)).astype(np.int64)
+        bitidx = []
+        start = self.wordidx_size
+        for n in range(self.hash_groups*self.nhash):
+            if wide:
+                bitidx.append(self.scaled_bitidx_many(digests, start))
+            else:
+                bitidx.append(self.extract_field(digests, start, self.bitidx_size))
+            start += self.bitidx_size
+        if self.grow_bits:
+            grown = self.extract_field(digests, start, self.grow_bits).astype(np.int64)
+            wordidx = (wordidx << self.grow_bits) | grown
+        return wordidx, self.masks_many(bitidx, lanes, scaled=wide)
+
+    # Extracts from every row of digests the bit index starting at bit start
+    # and scales it to scale_bits, (bitidx*scale_bits) >> bitidx_size, when
+    # the product does not fit in 64 bits. The index is split in its low 64
+    # bits and the rest, and the high half of the product of the low bits
+    # is calculated in 32-bit halves, so the result is exact
+    def scaled_bitidx_many(self, digests, start):
+        size = self.bitidx_size
+        high_size = max(0, size - 64)
+        high = self.extract_field(digests, start, high_size)
+        low = self.extract_field(digests, start + high_size, size - high_size)
+        scale = np.uint64(self.scale_bits)
+        half = np.uint64(32)
+        carry = ((low >> half) * scale + ((low & np.uint64(0xFFFFFFFF)) * scale >> half)) >> half
+        # the product is upper*2^64 + the low 64 bits of low*scale
+        upper = high * scale + carry
+        if size >= 64:
+            return upper >> np.uint64(size - 64)
+        return (upper << np.uint64(64 - size)) | (low * scale >> np.uint64(size))
+
+    # Builds the masks of indices_many from the list with the array of bit
+    # indices of each of the hash_groups*nhash functions, before scaling
+    # unless scaled is set
+    def masks_many(self, bitidx, lanes=1, scaled=False):
+        n = len(bitidx[0]) if bitidx else 0
+        masks = np.zeros((n, self.hash_groups, lanes), dtype=np.uint64)
+        rows = np.arange(n)
+        for i, idx in enumerate(bitidx):
+            if self.scale_bits is not None and not scaled:
+                idx = idx * np.uint64(self.scale_bits) >> np.uint64(self.bitidx_size)
+            masks[rows, i // self.nhash, (idx >> np.uint64(6)).astype(np.intp)] |= np.uint64(1) << (idx & np.uint64(63))
+        return masks
+
+    # Builds the result of indices_many calling indices for each element.
+    # The lanes of the masks are collected as integers and converted
+    # to arrays once
+    def indices_scalar(self, elements, lanes=1):
+        wordidx = []
+        lane_masks = []
+        shifts = [64*j for j in range(lanes)]
+        M = 0xFFFFFFFFFFFFFFFF
+        for element in elements:
+            w, group_masks = self.indices(element)
+            wordidx.append(w)
+            if lanes == 1:
+                lane_masks.extend(group_masks)
+            else:
+                lane_masks.extend([(mask >> shift) & M for mask in group_masks for shift in shifts])
+        masks = np.array(lane_masks, dtype=np.uint64).reshape(len(wordidx), self.hash_groups, lanes)
+        return np.array(wordidx, dtype=np.int64), masks
+
+    # Returns the actual hash used to build the indices as a binary string
+    def getHash(self, element):
+        return bin(self.digest(element))[2:].zfill(self.digest_bits)
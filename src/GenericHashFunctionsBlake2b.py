@@ -0,0 +1,57 @@
+import functools
+import hashlib
+import math
+from GenericHashFunctions import GenericHashFunctions
+
+# BLAKE2b hash family. The digest is extended on demand to the bits needed
+# by the geometry, so any number of words, groups and bit indices can be
+# used: up to 512 bits a single BLAKE2b digest of the smallest size that
+# covers them is used, as it is the cheapest one. Beyond that, the element
+# is re-hashed with BLAKE2b seeded with the block number (personalization)
+# and the digests are concatenated
+class GenericHashFunctionsBlake2b(GenericHashFunctions):
+
+    # name of the hash family in the registry
+    name = 'blake2b'
+
+    # maximum size in bytes of a BLAKE2b digest
+    MAX_DIGEST_SIZE = 64
+    # size in bytes of the digest appended when grow runs out of bits
+    GROW_DIGEST_SIZE = 8
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, cache_size=1024):
+        # bits needed to build the word index and all the bit indices
+        needed = math.ceil(math.log2(words)) + hash_groups*nhash*int(math.log2(bits))
+        # and the extra bits of the word index when words is not a power of 2
+        if words != 1 << math.ceil(math.log2(words)):
+            needed += self.REDUCE_BITS
+        digest_size = max(1, (needed + 7) // 8)
+        # the size of each of the digests concatenated. All of them are of
+        # the maximum size except the last one
+        self.sizes = [self.MAX_DIGEST_SIZE] * ((digest_size - 1) // self.MAX_DIGEST_SIZE)
+        self.sizes.append(digest_size - sum(self.sizes))
+        # the blake2b result is split in a way the subsets are used for
+        # all the hash functions
+        super().__init__(words, bits, nhash, hash_groups,
+                         functools.partial(hashlib.blake2b, digest_size=self.sizes[0]), digest_size*8, cache_size)
+        return
+
+    # Double the number of words indexed (see GenericHashFunctions.grow).
+    # When the digest has no bits left, it is extended with one more seeded
+    # digest, so the bits already used do not change
+    def grow(self):
+        if self.fields_size() + self.grow_bits + 1 > self.digest_bits:
+            self.sizes.append(self.GROW_DIGEST_SIZE)
+            self.digest_bits += self.GROW_DIGEST_SIZE*8
+            # the digests cached are shorter
+            self.cache_clear()
+        super().grow()
+        return
+
+    # Returns the digest of a key, concatenating the digests of the
+    # seeded re-hashing when more than 512 bits are needed
+    def digest_bytes(self, key):
+        if len(self.sizes) == 1:
+            return self.hash(key).digest()
+        return b"".join(hashlib.blake2b(key, digest_size=size, person=i.to_bytes(8, 'little')).digest()
+                        for i, size in enumerate(self.sizes))
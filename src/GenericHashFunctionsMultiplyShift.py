@@ -0,0 +1,185 @@
+import math
+import random
+import zlib
+import numpy as np
+from GenericHashFunctions import GenericHashFunctions
+
+# Multiply-shift hash family. Each element is hashed once into a 64-bit
+# value x (its CRC-32 and Adler-32 checksums, non-cryptographic hashes
+# computed in C, in the high and the low half), and the indices are
+# obtained from x with multiply-shift functions instead of extracting
+# fields of a long digest:
+#   * the word index with ((a*x + b) mod 2^64) >> (64 - size)
+#   * the bit indices of a group with a single wider function,
+#     (a*x) >> 64 with a of 64 + l bits, whose l bits hold the indices
+#     of the group (several functions if they do not fit in 64 bits)
+# The functions are done with 64-bit integers, so the indices of a batch
+# of elements are built with NumPy vector operations
+class GenericHashFunctionsMultiplyShift(GenericHashFunctions):
+
+    # name of the hash family in the registry
+    name = 'multshift'
+
+    MASK64 = (1 << 64) - 1
+    MASK32 = (1 << 32) - 1
+
+    def __init__(self, words=1024, bits=64, nhash=2, hash_groups=2, seed=0, cache_size=1024):
+        # the size of each bit index. Widths that are not power of 2
+        # are supported by scaling the bit index (see convert_bitidx)
+        bitidx_size = math.ceil(math.log2(bits))
+        # every index comes from its own function, so there is no limit
+        # in the number of bits provided
+        needed = math.ceil(math.log2(words)) + hash_groups*nhash*bitidx_size
+        super().__init__(words, bits, nhash, hash_groups, None, needed, cache_size)
+        self.bitidx_size = bitidx_size
+        # the word index function can provide all the extra bits of the
+        # field reduced to words
+        if self.reduce_words:
+            self.wordidx_size = self.words_size + self.REDUCE_BITS
+        if bits != 1 << bitidx_size:
+            self.scale_bits = bits
+        assert self.wordidx_size <= 64 and 0 < self.bitidx_size <= 64
+
+        rnd = random.Random(seed)
+        # multiplier (odd) and addend of the function of the word index and
+        # of the function providing the bits added to it by grow
+        self.mult = [rnd.getrandbits(64) | 1 for i in range(2)]
+        self.add = [rnd.getrandbits(64) for i in range(2)]
+        # functions of the bit indices of each group: a list of (a, shifts)
+        # with the multiplier of each function and the position in its
+        # result of each of the bit indices it provides, the first one in
+        # the most significant bits
+        per_function = 64 // bitidx_size
+        self.bit_functions = []
+        for g in range(hash_groups):
+            functions = []
+            for first in range(0, nhash, per_function):
+                count = min(per_function, nhash - first)
+                size = count * bitidx_size
+                shifts = tuple(size - (n+1)*bitidx_size for n in range(count))
+                functions.append((rnd.getrandbits(64 + size) | 1, shifts))
+            self.bit_functions.append(functions)
+        return
+
+    # Double the number of words indexed (see GenericHashFunctions.grow).
+    # The bits added come from their own function, so there is no limit
+    def grow(self):
+        if self.wordidx_size + self.grow_bits + 1 > 64:
+            raise ValueError("The word index cannot grow beyond 64 bits")
+        self.grow_bits += 1
+        return
+
+    # Adds to the word index the bits added by grow, from the value h
+    def grown_wordidx(self, h, wordidx):
+        return (wordidx << self.grow_bits) | self.function(h, 1, self.grow_bits)
+
+    # Calculates the 64-bit value a key (bytes) is hashed into
+    def compute(self, key):
+        return zlib.crc32(key) << 32 | zlib.adler32(key)
+
+    # Applies the ith multiply-shift function to x, returning size bits
+    def function(self, x, i, size):
+        if size == 0:
+            return 0
+        return ((self.mult[i] * x + self.add[i]) & self.MASK64) >> (64 - size)
+
+    # Retrieves the bit index (scaled to the width if needed)
+    def convert_bitidx(self, bitidx):
+        if self.scale_bits is None:
+            return bitidx
+        return bitidx * self.scale_bits >> self.bitidx_size
+
+    # Retrieves the word index (the appropriate block) for the element
+    def getword_idx(self, element):
+        h = self.digest(element)
+        wordidx = self.reduce_wordidx(self.function(h, 0, self.wordidx_size))
+        if self.grow_bits:
+            wordidx = self.grown_wordidx(h, wordidx)
+        return wordidx
+
+    # Retrieves the bit index using the nth hash from group for the element
+    def getbit_idx(self, element, n, group):
+        assert group < self.hash_groups
+        a, shifts = self.bit_functions[group][n // (64 // self.bitidx_size)]
+        bitidx = (a * self.digest(element) >> 64 >> shifts[n % (64 // self.bitidx_size)]) & ((1 << self.bitidx_size) - 1)
+        return self.convert_bitidx(bitidx)
+
+    # Retrieves, with a single hash calculation, the word index of the element
+    # and a tuple with the mask of the nhash bits selected by each group
+    def indices(self, element):
+        h = self.digest(element)
+        # the functions are inlined, as this is the hot path
+        wordidx = ((self.mult[0] * h + self.add[0]) & self.MASK64) >> (64 - self.wordidx_size)
+        if self.reduce_words:
+            wordidx = wordidx * self.words >> self.wordidx_size
+        scale = self.scale_bits
+        size = self.bitidx_size
+        bitidx_mask = (1 << size) - 1
+        masks = []
+        for functions in self.bit_functions:
+            mask = 0
+            for a, shifts in functions:
+                value = a * h >> 64
+                if scale is None:
+                    for shift in shifts:
+                        mask |= 1 << ((value >> shift) & bitidx_mask)
+                else:
+                    for shift in shifts:
+                        mask |= 1 << (((value >> shift) & bitidx_mask) * scale >> size)
+            masks.append(mask)
+        if self.grow_bits:
+            wordidx = self.grown_wordidx(h, wordidx)
+        return wordidx, tuple(masks)
+
+    # Returns the 64-bit values of a batch of elements as an array
+    def digests_many(self, elements):
+        keys = [e.encode() if isinstance(e, str) else e for e in elements]
+        crc = np.fromiter(map(zlib.crc32, keys), dtype=np.uint64, count=len(keys))
+        adler = np.fromiter(map(zlib.adler32, keys), dtype=np.uint64, count=len(keys))
+        return (crc << np.uint64(32)) | adler
+
+    # Vectorized version of indices for a batch of elements (see GenericHashFunctions)
+    def indices_many(self, elements, lanes=1):
+        if not isinstance(elements, list):
+            elements = list(elements)
+        # the reduction of the word index is done with 64-bit arithmetic
+        if self.reduce_words and self.wordidx_size + self.words_size > 64:
+            return self.indices_scalar(elements, lanes)
+        h = self.digests_many(elements)
+        wordidx = self.reduce_wordidx_many(self.function_many(h, 0, self.wordidx_size)).astype(np.int64)
+        bitidx_mask = np.uint64((1 << self.bitidx_size) - 1)
+        bitidx = []
+        for functions in self.bit_functions:
+            for a, shifts in functions:
+                value = self.wide_function_many(h, a)
+                bitidx.extend((value >> np.uint64(shift)) & bitidx_mask for shift in shifts)
+        if self.grow_bits:
+            grown = self.function_many(h, 1, self.grow_bits).astype(np.int64)
+            wordidx = (wordidx << self.grow_bits) | grown
+        return wordidx, self.masks_many(bitidx, lanes)
+
+    # Applies the ith multiply-shift function to an array of values
+    def function_many(self, x, i, size):
+        if size == 0:
+            return np.zeros(len(x), dtype=np.uint64)
+        return (x * np.uint64(self.mult[i]) + np.uint64(self.add[i])) >> np.uint64(64 - size)
+
+    # Returns the low 64 bits of (a*x) >> 64 for an array of values x.
+    # a is split in its high bits and its low 64 bits, whose product with
+    # x is done in 32-bit halves to get its high 64 bits
+    def wide_function_many(self, x, a):
+        M = np.uint64(self.MASK32)
+        s = np.uint64(32)
+        a_lo = a & self.MASK64
+        a0, a1 = np.uint64(a_lo & self.MASK32), np.uint64(a_lo >> 32)
+        x0, x1 = x & M, x >> s
+        low = x0 * a0
+        cross0 = x0 * a1
+        cross1 = x1 * a0
+        middle = (low >> s) + (cross0 & M) + (cross1 & M)
+        high = x1 * a1 + (cross0 >> s) + (cross1 >> s) + (middle >> s)
+        return x * np.uint64((a >> 64) & self.MASK64) + high
+
+    # Returns the 64-bit value used to build the indices as a binary string
+    def getHash(self, element):
+        return bin(self.digest(element))[2:].zfill(64)
@@ -0,0 +1,26 @@
+from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
+from GenericHashFunctionsSHA512All import GenericHashFunctionsSHA512All
+from GenericHashFunctionsBlake2b import GenericHashFunctionsBlake2b
+from GenericHashFunctionsMultiplyShift import GenericHashFunctionsMultiplyShift
+
+# Registry of the hash families that can be selected by name (-a option).
+# A hash family is a class built as cls(words, bits, nhash, hash_groups, cache_size=n)
+# that provides getword_idx, getbit_idx, indices and indices_many
+hashFamilies = {}
+
+# Add a hash family to the registry under its name
+def registerHashFamily(cls, name=None):
+    hashFamilies[name if name is not None else cls.name] = cls
+    return
+
+# Build the hash object of the family registered as name, keeping the
+# digests of the last cache_size elements
+def buildHash(name, words=1024, bits=64, nhash=2, hash_groups=2, cache_size=1024):
+    if name not in hashFamilies:
+        raise ValueError("Unknown hash family %s. Available: %s" % (name, ", ".join(hashFamilies)))
+    return hashFamilies[name](words, bits, nhash, hash_groups, cache_size=cache_size)
+
+for cls in (GenericHashFunctionsMD5, GenericHashFunctionsSHA512, GenericHashFunctionsSHA512All,
+            GenericHashFunctionsBlake2b, GenericHashFunctionsMultiplyShift):
+    registerHashFamily(cls)
@@ -0,0 +1,148 @@
+from array import array
+import numpy as np
+from GenericSlowMemoryRepresentation import GenericSlowMemoryRepresentation
+
+# Slow memory that also keeps a small counter per bit of every word of
+# every group, so that elements can be removed. A bit of a word is set
+# while its counter is not zero. Counters are 4 bits, packed two per byte.
+# A counter that reaches its maximum is never decremented again, as the
+# number of elements setting that bit is no longer known.
+# The counters are kept in memory even if the words are placed in a file
+# or in a buffer
+class GenericSlowMemoryCounting(GenericSlowMemoryRepresentation):
+
+    COUNTER_BITS = 4
+    COUNTER_MAX = (1 << COUNTER_BITS) - 1
+
+    def __init__(self, words=2048, bits=32, hash_groups=2, filename=None, buffer=None):
+        super().__init__(words, bits, hash_groups, filename, buffer)
+        # the counter of bit b of the wordidx-indexed word of a group is
+        # at position (group*words + wordidx)*bits + b. Even positions are
+        # in the low half of the byte
+        self.counters = array('B', [0]) * ((hash_groups * words * bits + 1) // 2)
+        if buffer is not None or filename is not None:
+            # the words may not be empty, count each of their bits once
+            self.rebuild_counters()
+        return
+
+    def getcounter(self, pos):
+        return (self.counters[pos >> 1] >> ((pos & 1) * self.COUNTER_BITS)) & self.COUNTER_MAX
+
+    def setcounter(self, pos, value):
+        shift = (pos & 1) * self.COUNTER_BITS
+        self.counters[pos >> 1] = (self.counters[pos >> 1] & ~(self.COUNTER_MAX << shift)) | (value << shift)
+        return
+
+    # set the bits of the mask in the wordidx-indexed word
+    # hashed with a specific group of functions, incrementing their counters
+    def setbit(self, group, wordidx, mask):
+        wordinit = (group*self.words + wordidx)*self.bits
+        remaining = mask
+        while remaining:
+            low = remaining & -remaining
+            pos = wordinit + low.bit_length() - 1
+            counter = self.getcounter(pos)
+            if counter < self.COUNTER_MAX:
+                self.setcounter(pos, counter + 1)
+            remaining ^= low
+        super().setbit(group, wordidx, mask)
+        return
+
+    # decrement the counters of the bits of the mask in the wordidx-indexed
+    # word hashed with a specific group of functions, clearing the bits
+    # whose counters reach zero. Returns the new word
+    def clearbit(self, group, wordidx, mask):
+        wordinit = (group*self.words + wordidx)*self.bits
+        cleared = 0
+        remaining = mask
+        while remaining:
+            low = remaining & -remaining
+            pos = wordinit + low.bit_length() - 1
+            counter = self.getcounter(pos)
+            if 0 < counter < self.COUNTER_MAX:
+                self.setcounter(pos, counter - 1)
+                if counter == 1:
+                    cleared |= low
+            remaining ^= low
+        word = self.getword(group, wordidx)
+        if cleared:
+            word &= ~cleared
+            self.setword(group, wordidx, word)
+        return word
+
+    # View of the counters as a NumPy array of bytes sharing their memory
+    def counters_view(self):
+        return np.frombuffer(self.counters, dtype=np.uint8)
+
+    # Positions of the counters of the bits of a batch of masks (elements x
+    # hash_groups x lanes) in the wordidx-indexed words, along with the
+    # number of times each position appears
+    def counter_positions(self, wordidx, masks):
+        masks = np.ascontiguousarray(masks, dtype='<u8')
+        bitset = np.unpackbits(masks.view(np.uint8).reshape(len(wordidx), self.hash_groups, -1),
+                               axis=2, bitorder='little')[:, :, :self.bits]
+        element, group, bit = np.nonzero(bitset)
+        pos = (group * self.words + np.asarray(wordidx, dtype=np.int64)[element]) * self.bits + bit
+        return np.unique(pos, return_counts=True)
+
+    # Add delta to the counters at the positions pos (without repetitions),
+    # keeping them between zero and their maximum. Saturated counters are
+    # not modified. Returns the new values of the counters
+    def add_counters(self, pos, delta):
+        counters = self.counters_view()
+        values = np.zeros(len(pos), dtype=np.int64)
+        # the two halves of a byte are updated separately, so that
+        # no byte is written twice in the same assignment
+        for half in (0, 1):
+            selected = (pos & 1) == half
+            byte = pos[selected] >> 1
+            shift = half * self.COUNTER_BITS
+            value = (counters[byte].astype(np.int64) >> shift) & self.COUNTER_MAX
+            value = np.where(value == self.COUNTER_MAX, value,
+                             np.clip(value + delta[selected], 0, self.COUNTER_MAX))
+            counters[byte] = (counters[byte] & ~np.uint8(self.COUNTER_MAX << shift)) | (value << shift).astype(np.uint8)
+            values[selected] = value
+        return values
+
+    # set the bits of a batch of masks in the wordidx-indexed words of
+    # every group, incrementing their counters
+    def setbits_many(self, wordidx, masks):
+        pos, count = self.counter_positions(wordidx, masks)
+        self.add_counters(pos, count)
+        super().setbits_many(wordidx, masks)
+        return
+
+    # decrement the counters of a batch of masks in the wordidx-indexed
+    # words of every group, clearing the bits whose counters reach zero
+    def clearbits_many(self, wordidx, masks):
+        pos, count = self.counter_positions(wordidx, masks)
+        values = self.add_counters(pos, -count)
+        pos = pos[values == 0]
+        bit = pos % self.bits
+        word = pos // self.bits
+        back = self.back_view().reshape(-1)
+        np.bitwise_and.at(back, word * self.lanes + (bit >> 6),
+                          ~(np.uint64(1) << (bit & 63).astype(np.uint64)))
+        return
+
+    # Place the words over buf (see GenericSlowMemoryRepresentation.use_buffer).
+    # If the words take the contents of buf, the counters are set from them
+    def use_buffer(self, buf, copy=True):
+        super().use_buffer(buf, copy)
+        if not copy:
+            self.rebuild_counters()
+        return
+
+    # Set the counters from the current words, counting each bit set once
+    def rebuild_counters(self):
+        back = np.ascontiguousarray(self.back_view(), dtype='<u8')
+        bitset = np.unpackbits(back.view(np.uint8).reshape(self.hash_groups * self.words, -1),
+                               axis=1, bitorder='little')[:, :self.bits].reshape(-1)
+        if len(bitset) % 2:
+            bitset = np.append(bitset, 0)
+        self.counters_view()[:] = bitset[0::2] | (bitset[1::2] << self.COUNTER_BITS)
+        return
+
+    # number of bytes used by the slow memory, counters included
+    def memory_footprint(self):
+        return super().memory_footprint() + memoryview(self.counters).nbytes
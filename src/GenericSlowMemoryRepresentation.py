@@ -1,64 +1,127 @@
 import math
+import mmap
+from array import array
+import numpy as np
 
 # A dummy representation of a Slow memory backend where the
 # hashed words with both functions are stored
 class GenericSlowMemoryRepresentation:
 
-    def __init__(self, words=2048, bits=32, hash_groups=2):
+    # number of bits held by each machine integer (lane) of the packed structure
+    LANE_BITS = 64
+    LANE_MASK = (1 << LANE_BITS) - 1
+
+    def __init__(self, words=2048, bits=32, hash_groups=2, filename=None, buffer=None):
         # number of blocks/words
         self.words = words
         # number of bits per block
         self.bits = bits
         # the number of total hash groups (f, g ...)
         self.hash_groups = hash_groups
+        # number of 64-bit lanes needed to store a word
+        self.lanes = (bits + self.LANE_BITS - 1) // self.LANE_BITS
 
-        # the structures are stored as flattened arrays
+        # the structures are stored as packed arrays of unsigned 64-bit
+        # integers, lanes consecutive integers per word.
         # Each group is stored consecutive to the previous one
-        self.back_bloom = [False] * hash_groups * (words * bits)
-        
+        size = hash_groups * words * self.lanes
+        if buffer is not None:
+            # the words are placed over the buffer received, taking its contents
+            self.file = None
+            self.mm = None
+            self.back_bloom = memoryview(buffer).cast('B')[:size * 8].cast('Q')
+        elif filename is None:
+            self.file = None
+            self.mm = None
+            self.back_bloom = array('Q', [0]) * size
+        else:
+            # back the slow memory by a file so that it can be larger
+            # than the available RAM. The file is created filled with zeros
+            self.file = open(filename, 'w+b')
+            self.file.truncate(size * 8)
+            self.mm = mmap.mmap(self.file.fileno(), size * 8)
+            self.back_bloom = memoryview(self.mm).cast('Q')
+
         # the size of the word index
-        self.wordidx_size = int(math.log2(words))
+        self.wordidx_size = math.ceil(math.log2(words))
         # the size of each bit index to set/get a bit from the word
         self.bitidx_size = int(math.log2(bits))
         return
 
-    # set the corresponding bits for words hashed with
-    # all the groups of functions
-    def setbit(self, idx_array):
-        for i in idx_array:
-            self.back_bloom[i] = True
-        return
-
-    # set the corresponding bits for words hashed with
-    # a specific groups of functions
-    def setbit(self, group, wordidx, idx_array):
-        for i in idx_array:
-            actual_i = (group*self.words + wordidx)*self.bits + i
-            self.back_bloom[actual_i] = True
+    # set the bits of the mask in the wordidx-indexed word
+    # hashed with a specific group of functions
+    def setbit(self, group, wordidx, mask):
+        wordinit = (group*self.words + wordidx)*self.lanes
+        if self.lanes == 1:
+            self.back_bloom[wordinit] |= mask
+            return
+        for j in range(self.lanes):
+            self.back_bloom[wordinit+j] |= (mask >> (j*self.LANE_BITS)) & self.LANE_MASK
         return
 
     # get the wordidx-indexed word hashed by the
-    # selected function (group)
+    # selected function (group) as an integer
     def getword(self, group, wordidx):
         assert group<self.hash_groups
         # calculate where the current word starts for the appropriate group
-        wordinit = (group*self.words + wordidx)*self.bits
-
-        # Getting the proper word 
-        word = self.back_bloom[wordinit:wordinit+self.bits]
+        wordinit = (group*self.words + wordidx)*self.lanes
+        if self.lanes == 1:
+            return self.back_bloom[wordinit]
 
+        # join the lanes of the word, the first one holding the lowest bits
+        word = 0
+        for j in range(self.lanes):
+            word |= self.back_bloom[wordinit+j] << (j*self.LANE_BITS)
         return word
 
     # set the wordidx-indexed block hashed by the
     # selected function replacing its value by word
     # return the old word
     def setword(self, group, wordidx, word):
-        assert group<self.hash_groups
+        oldword = self.getword(group, wordidx)
         # calculate where the current word starts for the appropriate group
-        wordinit = (group*self.words + wordidx)*self.bits
+        wordinit = (group*self.words + wordidx)*self.lanes
         # Replacing the proper word
-        oldword = self.back_bloom[wordinit:wordinit+self.bits]
-        self.back_bloom[wordinit:wordinit+self.bits] = word
+        for j in range(self.lanes):
+            self.back_bloom[wordinit+j] = (word >> (j*self.LANE_BITS)) & self.LANE_MASK
         return oldword
-        
 
+    # set the bits of a batch of masks (elements x hash_groups x lanes, as
+    # returned by indices_many) in the wordidx-indexed words of every group
+    def setbits_many(self, wordidx, masks):
+        back = self.back_view()
+        for g in range(self.hash_groups):
+            for j in range(self.lanes):
+                np.bitwise_or.at(back[g, :, j], wordidx, masks[:, g, j])
+        return
+
+    # View of the words as a NumPy array (hash_groups x words x lanes) sharing their memory
+    def back_view(self):
+        return np.frombuffer(self.back_bloom, dtype=np.uint64).reshape(self.hash_groups, self.words, self.lanes)
+
+    # number of bytes used by the slow memory
+    def memory_footprint(self):
+        return memoryview(self.back_bloom).nbytes
+
+    # number of bytes used by the words of all the groups
+    def buffer_size(self):
+        return self.hash_groups * self.words * self.lanes * self.LANE_BITS // 8
+
+    # Place the words over buf, a writable buffer of at least buffer_size()
+    # bytes. With copy, the current words are copied to buf. Otherwise
+    # the slow memory takes the contents of buf
+    def use_buffer(self, buf, copy=True):
+        back_bloom = memoryview(buf).cast('B')[:self.buffer_size()].cast('Q')
+        if copy:
+            back_bloom[:] = memoryview(self.back_bloom)
+        self.back_bloom = back_bloom
+        return
+
+    # release the file backing the slow memory, if any
+    def close(self):
+        if self.mm is not None:
+            self.back_bloom.release()
+            self.mm.close()
+            self.file.close()
+            self.mm = None
+        return
@@ -0,0 +1,72 @@
+import os
+import string
+import numpy as np
+
+# Generator of random synthetic elements (strings of printable characters)
+# built in batches from NumPy random numbers. Elements are handled as rows
+# of a matrix of bytes padded with zeros up to the maximum length, so that
+# repetitions and excluded elements are filtered in bulk.
+# Using the same seed generates the same elements
+class SyntheticWorkload:
+
+    def __init__(self, seed=None, minlen=3, maxlen=50, weights=None, alphabet=string.printable):
+        # random number generator (a sequence of integers is also a valid seed)
+        self.rng = np.random.default_rng(seed)
+        # minimum and maximum length of the elements
+        self.minlen = minlen
+        self.maxlen = maxlen
+        # probability of each length from minlen to maxlen (uniform if None)
+        if weights is None:
+            self.weights = None
+        else:
+            self.weights = np.asarray(weights, dtype=float) / sum(weights)
+            assert len(self.weights) == maxlen - minlen + 1
+        # characters used to build the elements. Zero is used as padding
+        self.alphabet = np.frombuffer(alphabet.encode(), dtype=np.uint8)
+        assert 0 not in self.alphabet
+        return
+
+    # Generate num random rows, that may be repeated
+    def candidates(self, num):
+        if self.weights is None:
+            lengths = self.rng.integers(self.minlen, self.maxlen+1, num)
+        else:
+            lengths = self.minlen + self.rng.choice(len(self.weights), num, p=self.weights)
+        rows = self.alphabet[self.rng.integers(0, len(self.alphabet), (num, self.maxlen))]
+        # pad each row after its length
+        rows[np.arange(self.maxlen) >= lengths[:, None]] = 0
+        return rows
+
+    # View the rows as an array of opaque values to compare them as a whole
+    def keys(self, rows):
+        return np.ascontiguousarray(rows).view(np.dtype((np.void, self.maxlen))).ravel()
+
+    # Generate num unique rows, none of them in the exclude rows.
+    # If cache is set, the rows are read from that file when it exists,
+    # or stored there otherwise
+    def generate(self, num, exclude=None, cache=None):
+        if cache is not None and os.path.exists(cache):
+            return np.load(cache)
+
+        rows = np.zeros((0, self.maxlen), dtype=np.uint8)
+        while len(rows) < num:
+            # generate some more candidates than needed to cover repetitions
+            rows = np.concatenate((rows, self.candidates(int((num - len(rows)) * 1.05) + 16)))
+            # keep the first appearance of each row, in order
+            first = np.sort(np.unique(self.keys(rows), return_index=True)[1])
+            rows = rows[first]
+            if exclude is not None and len(exclude):
+                rows = rows[~np.isin(self.keys(rows), self.keys(exclude))]
+        rows = rows[:num]
+
+        if cache is not None:
+            np.save(cache, rows)
+        return rows
+
+    # Convert the rows into a list of elements (bytes without the padding)
+    @staticmethod
+    def elements(rows):
+        size = rows.shape[1]
+        data = rows.tobytes()
+        lengths = np.count_nonzero(rows, axis=1).tolist()
+        return [data[i*size:i*size+length] for i, length in enumerate(lengths)]
@@ -0,0 +1,76 @@
+import os
+import itertools
+import numpy as np
+from TraceReader import TraceReader
+
+# Cache on disk of the hashed elements of a traces file for a given hash
+# class and filter geometry. The word index and the masks of every group
+# of each element are computed once and stored in two .npy files, which are
+# later read through numpy.memmap so the experiments only do memory work
+class TraceHashCache:
+
+    # number of elements hashed together when the cache is built
+    BATCH_SIZE = 65536
+
+    def __init__(self, filename, hash_f, lanes=1):
+        # base name of the cache files
+        self.filename = filename
+        # the hash class used to generate the functions
+        self.hash = hash_f
+        # number of 64-bit lanes of the masks (words wider than 64 bits)
+        self.lanes = lanes
+        # names of the files with the word indices and the masks
+        self.wordfile = filename + ".word.npy"
+        self.maskfile = filename + ".mask.npy"
+        return
+
+    # Check if the cache files exist and are newer than the traces file
+    def valid(self, traces):
+        if not (os.path.exists(self.wordfile) and os.path.exists(self.maskfile)):
+            return False
+        modified = os.path.getmtime(traces)
+        return os.path.getmtime(self.wordfile) >= modified and os.path.getmtime(self.maskfile) >= modified
+
+    # Hash all the elements (lines) of the traces file and store the results
+    def build(self, traces):
+        reader = TraceReader(traces)
+        # count the elements first to size the files
+        self.buildFrom(reader, reader.count())
+        return
+
+    # Hash the total elements of an iterable and store the results
+    def buildFrom(self, elements, total):
+        # word indices are stored with the smallest type that fits them
+        wordtype = np.uint32 if self.hash.wordidx_size <= 32 else np.uint64
+        words = np.lib.format.open_memmap(self.wordfile, mode='w+', dtype=wordtype, shape=(total,))
+        masks = np.lib.format.open_memmap(self.maskfile, mode='w+', dtype=np.uint64,
+                                          shape=(total, self.hash.hash_groups, self.lanes))
+        start = 0
+        elements = iter(elements)
+        while True:
+            batch = list(itertools.islice(elements, self.BATCH_SIZE))
+            if not batch:
+                break
+            wordidx, mask = self.hash.indices_many(batch, self.lanes)
+            words[start:start+len(batch)] = wordidx
+            masks[start:start+len(batch)] = mask
+            start += len(batch)
+        words.flush()
+        masks.flush()
+        del words, masks
+        return
+
+    # Open the cache files as read only memory maps. Returns the word
+    # indices and the masks of all the elements
+    def open(self):
+        words = np.load(self.wordfile, mmap_mode='r')
+        masks = np.load(self.maskfile, mmap_mode='r')
+        return words, masks
+
+    # Iterate over the cached elements in batches of size elements,
+    # returning the word indices and masks of each batch
+    def batches(self, size=BATCH_SIZE):
+        words, masks = self.open()
+        for start in range(0, len(words), size):
+            yield words[start:start+size].astype(np.int64), np.asarray(masks[start:start+size])
+        return
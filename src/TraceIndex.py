@@ -0,0 +1,67 @@
+import os
+from array import array
+import numpy as np
+from TraceReader import TraceReader
+
+# Index of a traces file where each distinct element (line) is mapped
+# once to a dense integer identifier. The trace is stored as an int32
+# array of identifiers, and the distinct elements as the concatenation
+# of their bytes plus an array with the offset of each one
+class TraceIndex:
+
+    def __init__(self, filename):
+        # base name of the index files
+        self.filename = filename
+        # names of the files with the trace identifiers and the distinct elements
+        self.idsfile = filename + ".ids.npy"
+        self.keysfile = filename + ".keys.bin"
+        self.offsetsfile = filename + ".offsets.npy"
+        return
+
+    # Check if the index files exist and are newer than the traces file
+    def valid(self, traces):
+        files = (self.idsfile, self.keysfile, self.offsetsfile)
+        if not all(os.path.exists(f) for f in files):
+            return False
+        modified = os.path.getmtime(traces)
+        return all(os.path.getmtime(f) >= modified for f in files)
+
+    # Assign an identifier to every distinct line of the traces file,
+    # in order of first appearance, and store the index files
+    def build(self, traces):
+        identifiers = {}
+        ids = array('i')
+        for lines in TraceReader(traces).blocks():
+            for line in lines:
+                ident = identifiers.get(line)
+                if ident is None:
+                    ident = len(identifiers)
+                    identifiers[line] = ident
+                ids.append(ident)
+        np.save(self.idsfile, np.frombuffer(ids, dtype=np.int32))
+        # dictionaries keep the insertion order, i.e. the identifier order
+        offsets = np.zeros(len(identifiers)+1, dtype=np.int64)
+        keys = list(identifiers)
+        offsets[1:] = np.cumsum([len(key) for key in keys])
+        np.save(self.offsetsfile, offsets)
+        with open(self.keysfile, 'wb') as f:
+            f.write(b"".join(keys))
+        return
+
+    # Returns the list of distinct elements, indexed by their identifier
+    def keys(self):
+        offsets = np.load(self.offsetsfile).tolist()
+        with open(self.keysfile, 'rb') as f:
+            raw = f.read()
+        return [raw[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+    # Returns the identifiers of the trace as a read only memory map
+    def ids(self):
+        return np.load(self.idsfile, mmap_mode='r')
+
+    # Iterate over the identifiers of the trace in batches of size elements
+    def batches(self, size=65536):
+        ids = self.ids()
+        for start in range(0, len(ids), size):
+            yield np.asarray(ids[start:start+size])
+        return
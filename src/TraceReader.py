@@ -0,0 +1,75 @@
+import bz2
+import gzip
+import lzma
+
+# Streaming reader of traces files. The file is read in large blocks of
+# bytes that are split in lines, and every element is returned as bytes
+# without the line terminator, ready to be hashed.
+# gzip, xz and bzip2 compressed files are detected by their magic number
+# and decompressed on the fly
+class TraceReader:
+
+    # magic numbers of the supported compressed formats
+    COMPRESSED = ((b"\x1f\x8b", gzip.open), (b"\xfd7zXZ\x00", lzma.open), (b"BZh", bz2.open))
+
+    def __init__(self, filename, blocksize=1 << 20):
+        # name of the traces file
+        self.filename = filename
+        # number of bytes read from the file at once
+        self.blocksize = blocksize
+        return
+
+    # Open the file as a binary stream, decompressing it if needed
+    def open(self):
+        with open(self.filename, 'rb') as f:
+            magic = f.read(6)
+        for prefix, opener in self.COMPRESSED:
+            if magic.startswith(prefix):
+                return opener(self.filename, 'rb')
+        return open(self.filename, 'rb')
+
+    # Iterate over the file returning lists with the complete lines
+    # of each block read
+    def blocks(self):
+        rest = b""
+        with self.open() as f:
+            while True:
+                data = f.read(self.blocksize)
+                if not data:
+                    break
+                data = rest + data
+                lines = data.split(b"\n")
+                # the last line may continue in the next block
+                rest = lines.pop()
+                # checked on the joined data, as a CRLF may be split between blocks
+                if b"\r" in data:
+                    lines = [line.rstrip(b"\r") for line in lines]
+                yield lines
+        if rest:
+            yield [rest.rstrip(b"\r")]
+        return
+
+    # Iterate over the file returning lists of size elements
+    # (the last one may be shorter)
+    def batches(self, size=65536):
+        batch = []
+        for lines in self.blocks():
+            batch.extend(lines)
+            if len(batch) >= size:
+                full = len(batch) - len(batch) % size
+                for start in range(0, full, size):
+                    yield batch[start:start+size]
+                batch = batch[full:]
+        if batch:
+            yield batch
+        return
+
+    # Iterate over the file returning one element at a time
+    def __iter__(self):
+        for lines in self.blocks():
+            yield from lines
+        return
+
+    # Number of elements in the file
+    def count(self):
+        return sum(len(lines) for lines in self.blocks())
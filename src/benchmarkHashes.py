@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+import sys, getopt
+import time
+import itertools
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericHashFunctionsRegistry import hashFamilies, buildHash
+from SyntheticWorkload import SyntheticWorkload
+from LogScreen import LogScreen
+from TraceReader import TraceReader
+
+# Main function
+def main(argv):
+    # Default values for
+    # Number of words in the filter
+    blocks = 1024
+    # bit width per word
+    width = 64
+    # Number of hash functions to set a bit in the word
+    k=3
+    # Number of groups of functions that can be changed when a false
+    # positive is detected
+    groups=2
+    # Elements stored in the filter will be factor*blocks
+    factor=8
+    # Number of negatives tested to measure the FPR
+    tests=100000
+    # Hash families to be compared (all the registered ones by default)
+    families = list(hashFamilies)
+    # Seed used to generate the elements
+    seed=0
+    # Size of the digest cache of the hash functions
+    cache_size=1024
+    # Traces file whose elements are used to measure the scalar cost (if any)
+    traces=None
+
+    # Retrieve the option values from command line
+    try:
+        opts, args = getopt.getopt(argv[1:],"hb:w:k:g:f:n:a:r:l:t:")
+    except getopt.GetoptError:
+        print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -n <tests> -a <hash1,hash2...> -r <seed> -l <cache_size> -t <filetraces>')
+        sys.exit(2)
+
+    for opt, arg in opts:
+        # Help option. Print help and leave.
+        if opt == '-h':
+           print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -n <tests> -a <hash1,hash2...> -r <seed> -l <cache_size> -t <filetraces>')
+           sys.exit()
+        # -b option for setting the number of words in the filter
+        elif opt == "-b":
+            blocks=int(arg)
+        # -w option to set the bit width within each word
+        elif opt == "-w":
+            width=int(arg)
+        # -k option to set the number of hash elements to select the bits to be set
+        elif opt == "-k":
+            k=int(arg)
+        # -g options to set the number of groups of hash functions to swap
+        elif opt == "-g":
+            groups=int(arg)
+        # -f option to set the factor (factor x words will be stored)
+        elif opt == "-f":
+            factor=int(arg)
+        # -n option to set the number of negatives tested
+        elif opt == "-n":
+            tests=int(arg)
+        # -a option to select the hash families compared (comma separated)
+        elif opt == "-a":
+            families = arg.split(",")
+            for f in families:
+                if f not in hashFamilies:
+                    print ('Unknown hash %s. Available: %s' % (f, ", ".join(hashFamilies)))
+                    sys.exit(2)
+        # -r option to set the seed used to generate the elements
+        elif opt == "-r":
+            seed=int(arg)
+        # -l option to set the size of the digest cache (0 disables it)
+        elif opt == "-l":
+            cache_size=int(arg)
+        # -t option to measure the scalar cost with the first elements of a traces file
+        elif opt == "-t":
+            traces=arg
+
+    run(blocks, width, k, groups, factor, tests, families, seed, cache_size, traces)
+
+# Measure, for every hash family, the cost per element of the scalar
+# (indices) and the batch (indices_many) hash calculation, and the FPR
+# of a filter storing factor*blocks elements, without and with adaptation.
+# The scalar cost is measured with the negatives, or with the first tests
+# elements of the traces file, if any, reporting the hits of the digest cache
+def run(blocks=1024, width=64, k=3, groups=2, factor=8, tests=100000, families=None, seed=0, cache_size=1024, traces=None):
+    sc = LogScreen()
+    if families is None:
+        families = list(hashFamilies)
+
+    # The same positives and negatives are used for all the families
+    positives = SyntheticWorkload((seed, 0)).generate(factor*blocks)
+    negatives = SyntheticWorkload((seed, 1)).generate(tests, exclude=positives)
+    positives = SyntheticWorkload.elements(positives)
+    negatives = SyntheticWorkload.elements(negatives)
+    scalars = negatives if traces is None else list(itertools.islice(TraceReader(traces), tests))
+
+    info = "Initializing parameters blocks=%d, width=%d, k=%d, groups=%d, factor=%d, tests=%d, cache_size=%d" % (blocks, width, k, groups, factor, tests, cache_size)
+    sc.write(info)
+    sc.write("%-10s %14s %10s %14s %10s %10s" % ("hash", "scalar ns/el", "cache hits", "batch ns/el", "FPR", "FPR adapt"))
+
+    for name in families:
+        hash = buildHash(name, blocks, width, k, groups, cache_size)
+        abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=hash)
+
+        # Cost of the scalar hash calculation
+        start = time.perf_counter()
+        for e in scalars:
+            hash.indices(e)
+        scalar = (time.perf_counter() - start) * 1e9 / len(scalars)
+        hits, misses, size, maxsize = hash.cache_info()
+
+        # Cost of the batch hash calculation
+        start = time.perf_counter()
+        wordidx, masks = hash.indices_many(negatives, abf.lanes)
+        batch = (time.perf_counter() - start) * 1e9 / len(negatives)
+
+        # FPR of the filter without swapping the functions
+        abf.add_many(positives)
+        abf.addslow_many(positives)
+        fp = int(np.count_nonzero(abf.check_indices(wordidx, masks)))
+        # FPR of the filter adapting to the false positives found
+        members = np.zeros(len(negatives), dtype=bool)
+        results, fpa = abf.check_adapt_indices(wordidx, masks, members)
+
+        sc.write("%-10s %14.1f %10.4f %14.1f %10.6f %10.6f" % (name, scalar, hits/(hits+misses), batch, fp/len(negatives), fpa/len(negatives)))
+    return
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import sys, getopt
+import time
+import numpy as np
+from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
+from GenericHashFunctionsRegistry import hashFamilies, buildHash
+from SyntheticWorkload import SyntheticWorkload
+from LogScreen import LogScreen
+
+# Main function
+def main(argv):
+    # Default values for
+    # Number of words in the filter
+    blocks = 1024
+    # bit widths per word compared
+    widths = [32, 64, 128, 256, 512]
+    # Number of hash functions to set a bit in the word
+    k=3
+    # Number of groups of functions that can be changed when a false
+    # positive is detected
+    groups=2
+    # Elements stored in the filter will be factor*blocks
+    factor=8
+    # Number of negatives checked
+    tests=100000
+    # Type of hash function
+    hash_f="md5"
+    # Seed used to generate the elements
+    seed=0
+
+    # Retrieve the option values from command line
+    try:
+        opts, args = getopt.getopt(argv[1:],"hb:w:k:g:f:n:a:r:")
+    except getopt.GetoptError:
+        print ('argv[0] -b <words> -w <width1,width2...> -k <bits> -g <function_groups> -f <factor> -n <tests> -a <hash> -r <seed>')
+        sys.exit(2)
+
+    for opt, arg in opts:
+        # Help option. Print help and leave.
+        if opt == '-h':
+           print ('argv[0] -b <words> -w <width1,width2...> -k <bits> -g <function_groups> -f <factor> -n <tests> -a <hash> -r <seed>')
+           sys.exit()
+        # -b option for setting the number of words in the filter
+        elif opt == "-b":
+            blocks=int(arg)
+        # -w option to set the bit widths compared (comma separated)
+        elif opt == "-w":
+            widths=[int(w) for w in arg.split(",")]
+        # -k option to set the number of hash elements to select the bits to be set
+        elif opt == "-k":
+            k=int(arg)
+        # -g options to set the number of groups of hash functions to swap
+        elif opt == "-g":
+            groups=int(arg)
+        # -f option to set the factor (factor x words will be stored)
+        elif opt == "-f":
+            factor=int(arg)
+        # -n option to set the number of negatives checked
+        elif opt == "-n":
+            tests=int(arg)
+        # -a option to select the hash family
+        elif opt == "-a":
+            if arg not in hashFamilies:
+                print ('Unknown hash %s. Available: %s' % (arg, ", ".join(hashFamilies)))
+                sys.exit(2)
+            hash_f=arg
+        # -r option to set the seed used to generate the elements
+        elif opt == "-r":
+            seed=int(arg)
+
+    run(blocks, widths, k, groups, factor, tests, hash_f, seed)
+
+# Returns the number of cache lines read by the check of each word index,
+# given the address of the word structure of the filter abf
+def cacheLines(abf, wordidx):
+    base = np.frombuffer(abf.bloom_structure, dtype=np.uint64).ctypes.data
+    start = base + wordidx * abf.lanes * 8
+    # only the lanes holding bits of the word are read
+    end = start + (abf.bits + abf.LANE_BITS - 1) // abf.LANE_BITS * 8
+    line = abf.CACHE_LINE
+    return (end - 1) // line - start // line + 1
+
+# Measure, for every word width, the memory traffic per query of the packed
+# and the cache-line-aligned layouts: the cache lines (and bytes) read by
+# the check of each negative, as given by the address of its word, and the
+# cost per check of the scalar and the batch methods
+def run(blocks=1024, widths=None, k=3, groups=2, factor=8, tests=100000, hash_f="md5", seed=0):
+    sc = LogScreen()
+    if widths is None:
+        widths = [32, 64, 128, 256, 512]
+
+    positives = SyntheticWorkload((seed, 0)).generate(factor*blocks)
+    negatives = SyntheticWorkload((seed, 1)).generate(tests, exclude=positives)
+    positives = SyntheticWorkload.elements(positives)
+    negatives = SyntheticWorkload.elements(negatives)
+
+    info = "Initializing parameters blocks=%d, k=%d, groups=%d, factor=%d, tests=%d, hash=%s" % (blocks, k, groups, factor, tests, hash_f)
+    sc.write(info)
+    sc.write("%6s %8s %6s %10s %12s %10s %14s %14s" % ("width", "layout", "lanes", "lines/q", "max lines/q", "bytes/q", "scalar ns/q", "batch ns/q"))
+
+    for width in widths:
+        for aligned in (False, True):
+            hash = buildHash(hash_f, blocks, width, k, groups)
+            abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=hash,
+                                             aligned=aligned)
+            abf.add_many(positives)
+            wordidx, masks = hash.indices_many(negatives, abf.lanes)
+            lines = cacheLines(abf, wordidx)
+
+            # Cost of the scalar check, hashing included
+            start = time.perf_counter()
+            for e in negatives:
+                abf.check(e)
+            scalar = (time.perf_counter() - start) * 1e9 / len(negatives)
+
+            # Cost of the batch check, once the elements are hashed
+            start = time.perf_counter()
+            abf.check_indices(wordidx, masks)
+            batch = (time.perf_counter() - start) * 1e9 / len(negatives)
+
+            sc.write("%6d %8s %6d %10.3f %12d %10.1f %14.1f %14.1f" % (width, "aligned" if aligned else "packed", abf.lanes,
+                     lines.mean(), lines.max(), lines.mean()*abf.CACHE_LINE, scalar, batch))
+    return
+
+if __name__ == "__main__":
+    main(sys.argv)
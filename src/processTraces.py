@@ -1,12 +1,19 @@
 import random
+import itertools
 import sys, getopt
+import multiprocessing
+import struct
+import numpy as np
 from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
 from DataSet import DataSet
 from LogNull import LogNull
 from LogFile import LogFile
 from LogScreen import LogScreen
-from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
-from GenericHashFunctionsSHA512All import GenericHashFunctionsSHA512All
+from GenericHashFunctionsRegistry import hashFamilies, buildHash
+from TraceHashCache import TraceHashCache
+from TraceIndex import TraceIndex
+from TraceReader import TraceReader
+from FilterSnapshot import FilterSnapshot
 
 # Main method
 def main(argv):
@@ -30,35 +37,47 @@ def main(argv):
     hash_f = 'md5'
     # How many false positives are required to swap between groups of functions
     swap=1
+    # Number of processes running the iterations (1 runs them in this process)
+    processes=1
+    # Use a cache on disk with the hashed traces
+    cache=False
+    # Use an index of the distinct elements of the traces
+    index=False
+    # Reuse snapshots of the filters built in each iteration
+    snapshot=False
+
+    # -b, -w, -k, -g, -f and -s accept comma separated lists of values to
+    # sweep all their combinations
+    sweep = {}
 
     # Retrieve the option values from command line
     try:
-        opts, args = getopt.getopt(sys.argv[1:],"hb:w:k:g:f:t:d:a:s:")
+        opts, args = getopt.getopt(sys.argv[1:],"hb:w:k:g:f:t:d:a:s:p:ciz")
     except getopt.GetoptError:
-        print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -t <filetraces> -d <folder> -a <hash> -s <false_to_swap>')
+        print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -t <filetraces> -d <folder> -a <hash> -s <false_to_swap> -p <processes> -c -i -z')
         sys.exit(2)
 
     for opt, arg in opts:
         # Help option. Print help and leave.
         if opt == '-h':
-           print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -t <filetraces> -d <folder> -a <hash> -s <false_to_swap>')
+           print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -t <filetraces> -d <folder> -a <hash> -s <false_to_swap> -p <processes> -c -i -z')
            sys.exit()
         # -b option for setting the number of words in the filter
         elif opt == "-b":
-            blocks=int(arg)
+            sweep["blocks"]=[int(v) for v in arg.split(",")]
         # -w option to set the bit width within each word
         elif opt == "-w":
-            width=int(arg)
+            sweep["width"]=[int(v) for v in arg.split(",")]
         # -k option to set the number of hash elements to select the bits to be set
         elif opt == "-k":
-            k=int(arg)
+            sweep["k"]=[int(v) for v in arg.split(",")]
         # -g options to set the number of groups of hash functions to swap
         # among them when false positives are found
         elif opt == "-g":
-            groups=int(arg)
+            sweep["groups"]=[int(v) for v in arg.split(",")]
         # -f option to set the factor (factor x words will be stored)
         elif opt == "-f":
-            factor=int(arg)
+            sweep["factor"]=[int(v) for v in arg.split(",")]
         # -t option to define the traces file to be used
         elif opt == "-t":
             traces = arg
@@ -66,28 +85,86 @@ def main(argv):
         # are to be located
         elif opt == "-d":
             folder = arg
-        # -a option to change the default md5 hash to other ("sha512" supported)
+        # -a option to change the default md5 hash to other registered family
+        # (sha512, sha512b, blake2b, multshift)
         elif opt == "-a":
+            if arg not in hashFamilies:
+                print ('Unknown hash %s. Available: %s' % (arg, ", ".join(hashFamilies)))
+                sys.exit(2)
             hash_f = arg
         # -s option to change the number of false positives required to swap
         # between groups of functions.
         elif opt == "-s":
-            swap = int(arg)
+            sweep["swap"]=[int(v) for v in arg.split(",")]
+        # -p option to run the iterations (and the sweep) in a pool of processes
+        elif opt == "-p":
+            processes = int(arg)
+        # -c option to hash the traces once and keep them in a cache on disk
+        elif opt == "-c":
+            cache = True
+        # -i option to map the traces to identifiers of their distinct elements
+        elif opt == "-i":
+            index = True
+        # -z option to store the filters built in each iteration and reuse them
+        elif opt == "-z":
+            snapshot = True
+
+    # All the combinations of parameters to be run
+    combinations = list(itertools.product(sweep.get("blocks", [blocks]), sweep.get("width", [width]),
+                                          sweep.get("k", [k]), sweep.get("groups", [groups]),
+                                          sweep.get("factor", [factor]), sweep.get("swap", [swap])))
+    # Log files are distinguished by the swap value only when several are swept
+    swapname = len(sweep.get("swap", [swap])) > 1
+
+    # Build the caches of hashed traces needed by the combinations, once
+    # per geometry, before running any iteration
+    if cache or index:
+        for geometry in sorted(set(c[:4] for c in combinations)):
+            traceCache(traces, folder, *geometry, hash_f=hash_f, build=True, index=index)
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    # Dispatch the iterations of all the combinations before collecting
+    # any result, so that the pool is kept busy during the whole sweep
+    results = [dispatch(traces, folder, *c, hash_f=hash_f, pool=pool, cache=cache, index=index, snapshot=snapshot) for c in combinations]
+    # Pass the parameters to the report function
+    for c, r in zip(combinations, results):
+        report(traces, folder, *c, hash_f=hash_f, results=r, swapname=swapname)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return
+
+# Number of times to execute each experiment to get an average
+# There must exist as many files with the elements to be stored
+# as iterations.
+totalIterations=10
 
-    # Pass the parameters to the run function
-    run(traces, folder, blocks, width, k, groups, factor, hash_f, swap)
+# Run the actual experiment using the parameters received.
+# If a multiprocessing pool is received, the iterations run in the pool
+def run (traces, folder, blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1, pool=None, cache=False, index=False, snapshot=False):
+    if cache or index:
+        traceCache(traces, folder, blocks, width, k, groups, hash_f, build=True, index=index)
+    results = dispatch(traces, folder, blocks, width, k, groups, factor, swap, hash_f, pool, cache, index, snapshot)
+    report(traces, folder, blocks, width, k, groups, factor, swap, hash_f, results)
     return
 
-# Run the actual experiment using the parameters received
-def run (traces, folder, blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1):
-    # Number of times to execute each experiment to get an average
-    # There must exist as many files with the elements to be stored
-    # as iterations.
-    totalIterations=10
+# Start the iterations of an experiment. Returns an iterator over the
+# (fp, tp, tn) results of the iterations in order. Without a pool the
+# iterations run as the iterator is consumed
+def dispatch(traces, folder, blocks, width, k, groups, factor, swap, hash_f='md5', pool=None, cache=False, index=False, snapshot=False):
+    tasks = [(traces, folder, blocks, width, k, groups, factor, hash_f, swap, i, cache, index, snapshot) for i in range(1,totalIterations+1)]
+    if pool is None:
+        return itertools.starmap(runIteration, tasks)
+    return pool.imap(runIterationTask, tasks)
 
+# Log the results of the iterations of an experiment and their average
+def report(traces, folder, blocks, width, k, groups, factor, swap, hash_f='md5', results=(), swapname=False):
     # Definition of the name of the output files.
     logOutput = 'result_b%s_w%s_k%s_g%s_f%s' % (blocks, width, k, groups, factor)
     logOutput2 = 'resultmin_b%s_w%s_k%s_g%s_f%s' % (blocks, width, k, groups, factor)
+    if swapname:
+        logOutput += '_s%s' % swap
+        logOutput2 += '_s%s' % swap
 
     # LogNull does not print, LogFile prints to file and LogScreen to the default output
     # Change the objects depending on which one you want to use
@@ -107,99 +184,18 @@ def run (traces, folder, blocks=1024, width=64, k=3, groups=2, factor=8, hash_f=
     log.write(info+"\n")
     log2.write(info+"\n")
 
+    # Message printing the memory used by the fast memory (words and selectors) and the slow memory
+    footprint = GenericAdaptiveBloomFilter.geometry_footprint(blocks, width, groups)
+    info ="Memory footprint words=%d bytes, selectors=%d bytes, slow=%d bytes" % (footprint['words'], footprint['selectors'], footprint['slow'])
+    sc.write(info)
+    log.write(info+"\n")
+    log2.write(info+"\n")
+
     # False positive rate accumulation element
     fpr = 0
 
-    # Run the iterations and get the average
-    for i in range(1,totalIterations+1):
-        # The file name should be similar to "/directory/shuf8N_1024B_1.txt"
-        shuf_file = "%sshuf%sN_%sB_%s.txt" % (folder, factor, blocks, i)
-        # Data set that keeps the actual elements that were added to the filter
-        # to perform false positive check
-        ds = DataSet()
-        # AdaptiveBloomFilter file
-        abf = None
-        # Build the filter passing a SHA512 hash function
-        if hash_f == 'sha512':
-            sha = GenericHashFunctionsSHA512(words=blocks, bits=width, nhash=k, hash_groups=groups)
-            abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=sha)
-        elif hash_f == 'sha512b':
-            sha = GenericHashFunctionsSHA512All(words=blocks, bits=width, nhash=k, hash_groups=groups)
-            abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=sha)
-        # Otherwise build it using the default MD5 hash
-        else:
-            abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups)
-        # False positives initialized to zero
-        fp=0
-        # True positives initialized to zero
-        tp=0
-        # True negatives initialized to zero
-        tn=0
-        # factor * blocks elements are to be stored
-        maxin=factor*blocks
-
-        # Print the file name with the storable elements that is going to be used
-        sc.write(shuf_file)
-        # Open the file
-        dataToStore = open(shuf_file, 'r')
-
-        # Initializing the number of elements stored to zero
-        stored=0
-        # Keep storing until factor*blocks is reached or the file ends
-        while True:
-            if stored>=maxin:
-                break
-
-            entry = dataToStore.readline()
-            if not entry:
-                break
-            stored+=1
-            # Store into the Bloom filter
-            abf.add(entry)
-            # Store in the slow memory for all the groups of functions
-            abf.addslow(entry)
-            # Store the actual value to check for false positives
-            ds.add(entry)
-
-        # Close the file
-        dataToStore.close()
-
-        # Message to verify if we stored the expected number of elements
-        sc.write("length stored: %s" % ds.length())
-
-        # Open the file with the traces
-        caida = open(folder+traces, 'r')
-
-        # Process all elements
-        while True:
-            # Read next element
-            element = caida.readline()
-            if not element:
-                break
-            # By default, consider it a true negative
-            tn+=1
-            # If there is a match in the filter
-            if abf.check(element):
-                # If it is not an element that was stored
-                if not ds.test(element):
-                    # Then it is a false positive
-                    fp+=1
-                    # No longer considered true negative
-                    tn-=1
-                    # Swap between functions will ocurr every "swap" false
-                    # positives found. Use module operator to detect
-                    if fp%swap == 0:
-                        abf.swaphash(element)
-                # It was found and it was actually stored
-                else:
-                    # It is a true positive
-                    tp+=1
-                    # No longer considered true negative
-                    tn-=1
-
-        # Close the file with the traces
-        caida.close()
-
+    # Get the results of the iterations and the average
+    for i, (fp, tp, tn) in enumerate(results, 1):
         # Accumulate the False positive rate. It will be divided by the number of iterations
         fpr +=  fp/(fp+tn)
 
@@ -214,6 +210,140 @@ def run (traces, folder, blocks=1024, width=64, k=3, groups=2, factor=8, hash_f=
     sc.write(info)
     log.write(info+"\n")
     log2.write(info+"\n")
+    log2.close()
+    return
+
+# Returns the index of the distinct elements of the traces.
+# If build is set, the index is (re)built when missing or older than the traces
+def traceIndex(traces, folder, build=False):
+    ti = TraceIndex(folder+traces)
+    if build and not ti.valid(folder+traces):
+        LogScreen().write("Building traces index %s" % ti.filename)
+        ti.build(folder+traces)
+    return ti
+
+# Returns the cache of the hashed traces for a geometry and hash function.
+# With index, the cache holds the distinct elements of the traces index.
+# If build is set, the cache is (re)built when missing or older than the traces
+def traceCache(traces, folder, blocks, width, k, groups, hash_f='md5', build=False, index=False):
+    name = "%s%s.%s%s_b%s_w%s_k%s_g%s" % (folder, traces, "ids." if index else "", hash_f, blocks, width, k, groups)
+    lanes = (width + GenericAdaptiveBloomFilter.LANE_BITS - 1) // GenericAdaptiveBloomFilter.LANE_BITS
+    thc = TraceHashCache(name, buildHash(hash_f, blocks, width, k, groups), lanes)
+    if build and index:
+        ti = traceIndex(traces, folder, build)
+        if not thc.valid(ti.keysfile):
+            LogScreen().write("Building hashed traces cache %s" % name)
+            keys = ti.keys()
+            thc.buildFrom(keys, len(keys))
+    elif build and not thc.valid(folder+traces):
+        LogScreen().write("Building hashed traces cache %s" % name)
+        thc.build(folder+traces)
+    return thc
+
+# Check the traces against a filter using the traces index. Every
+# distinct element is hashed and tested once, and the trace is processed
+# as arrays of identifiers. Stored elements are always found by the filter,
+# so only the rest of the elements are checked against it.
+# Returns the number of false positives, true positives and true negatives
+def runIndexed(traces, folder, blocks, width, k, groups, hash_f, swap, abf, ds):
+    fp=0
+    tp=0
+    tn=0
+    ti = traceIndex(traces, folder)
+    # word index, masks and membership of every distinct element
+    idwords, idmasks = traceCache(traces, folder, blocks, width, k, groups, hash_f, index=True).open()
+    idwords = np.asarray(idwords, dtype=np.int64)
+    idmasks = np.asarray(idmasks)
+    idmembers = np.fromiter((ds.test(key) for key in ti.keys()), dtype=bool, count=len(idwords))
+
+    for ids in ti.batches(abf.BATCH_SIZE):
+        members = idmembers[ids]
+        # Elements that were stored are true positives
+        tp += int(np.count_nonzero(members))
+        # The rest are checked, swapping the functions on false positives
+        ids = ids[~members]
+        results, fp = abf.check_adapt_indices(idwords[ids], idmasks[ids], np.zeros(len(ids), dtype=bool), swap, fp)
+        tn += len(ids) - int(np.count_nonzero(results))
+    return fp, tp, tn
+
+# Unpack the parameters of an iteration received from the pool
+def runIterationTask(task):
+    return runIteration(*task)
+
+# Run the ith iteration of an experiment. Returns the number of
+# false positives, true positives and true negatives
+def runIteration(traces, folder, blocks, width, k, groups, factor, hash_f, swap, i, cache=False, index=False, snapshot=False):
+    sc = LogScreen()
+
+    # The file name should be similar to "/directory/shuf8N_1024B_1.txt"
+    shuf_file = "%sshuf%sN_%sB_%s.txt" % (folder, factor, blocks, i)
+    # Data set that keeps the actual elements that were added to the filter
+    # to perform false positive check
+    ds = DataSet()
+    # False positives initialized to zero
+    fp=0
+    # True positives initialized to zero
+    tp=0
+    # True negatives initialized to zero
+    tn=0
+    # factor * blocks elements are to be stored
+    maxin=factor*blocks
+
+    # Print the file name with the storable elements that is going to be used
+    sc.write(shuf_file)
+    # Read up to factor*blocks elements (or until the file ends)
+    entries = list(itertools.islice(TraceReader(shuf_file), maxin))
+    # Snapshot of the filter built with these elements, if used
+    snap = FilterSnapshot("%s.%s_b%s_w%s_k%s_g%s.abf" % (shuf_file, hash_f, blocks, width, k, groups)) if snapshot else None
+    abf = None
+    if snap is not None and snap.valid(shuf_file):
+        # AdaptiveBloomFilter loaded from the snapshot. A snapshot corrupted
+        # or removed meanwhile (by another process) is built again
+        try:
+            abf = snap.load(filter_class=GenericAdaptiveBloomFilter)
+        except (OSError, ValueError, struct.error) as e:
+            sc.write("snapshot %s not loaded (%s), building the filter" % (snap.filename, e))
+    if abf is None:
+        # AdaptiveBloomFilter file
+        abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups,
+                                         hash_f=buildHash(hash_f, blocks, width, k, groups))
+        # Store into the Bloom filter
+        abf.add_many(entries)
+        # Store in the slow memory for all the groups of functions
+        abf.addslow_many(entries)
+        if snap is not None:
+            snap.save(abf)
+    # Store the actual values to check for false positives
+    for entry in entries:
+        ds.add(entry)
+
+    # Message to verify if we stored the expected number of elements
+    sc.write("length stored: %s" % ds.length())
+
+    if index:
+        return runIndexed(traces, folder, blocks, width, k, groups, hash_f, swap, abf, ds)
+
+    # Hashed elements are read from the cache, if used
+    hashed = traceCache(traces, folder, blocks, width, k, groups, hash_f).batches(abf.BATCH_SIZE) if cache else None
+
+    # Process all elements in batches. The filter swaps the functions
+    # every "swap" false positives found, in the same order a loop
+    # checking one element at a time would do
+    for batch in TraceReader(folder+traces).batches(abf.BATCH_SIZE):
+        # Elements actually stored, to detect the false positives
+        members = np.fromiter((ds.test(element) for element in batch), dtype=bool, count=len(batch))
+        if hashed is not None:
+            wordidx, masks = next(hashed)
+            results, fp = abf.check_adapt_indices(wordidx, masks, members, swap, fp)
+        else:
+            results, fp = abf.check_adapt_many(batch, members, swap, fp)
+        # A match of an element that was stored is a true positive
+        tp += int(np.count_nonzero(results & members))
+        # Everything that was not a match is a true negative
+        tn += len(batch) - int(np.count_nonzero(results))
+
+    return fp, tp, tn
 
 
-main("")
+if __name__ == "__main__":
+    main(sys.argv)
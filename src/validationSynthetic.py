@@ -1,59 +1,14 @@
 #!/usr/bin/python3
 
-import random, string
+import numpy as np
 import sys, getopt
 from GenericAdaptiveBloomFilter import GenericAdaptiveBloomFilter
 from DataSet import DataSet
 from LogNull import LogNull
 from LogFile import LogFile
 from LogScreen import LogScreen
-from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
-from GenericHashFunctionsSHA512All import GenericHashFunctionsSHA512All
-
-# Function to generate the random set of elements.
-# Current version uses strings, but integers were also used
-# in previous versions
-# num is the number of elements to generate
-# if an AdaptiveBloomFilter abf is passed, elements are stored there
-# if a DataSet object ds is passed, elements are stored there
-# if a List lis is passed, elements are stored there.
-# exclude set are a elements that should not be selected
-def generateRandomElements(num, abf=None, ds=None, lis = None, exclude = set()):
-
-    # Elements are added to the set to check for repetitions
-    s = set()
-    s.clear()
-
-    # Keeps data of stored elements
-    stored = 0
-    # Generate elements until the value "stored" is reached
-    while stored < num:
-        # Generate strings of length between 3 a 50
-        entry = "".join(random.choice(string.printable) for i in range(random.randint(3,50)))
-        # if entry was already selected or is in the exclude set,
-        # go to next iteration
-        if entry in s or entry in exclude :
-            continue
-        # When an AdaptiveBloomFilter is received
-        if abf is not None:
-            # Add the entry to the filter
-            abf.add(entry)
-            # Add it to the slow memory backing it
-            abf.addslow(entry)
-        # When a DataSet is received
-        if ds is not None:
-            # Add the element to the DataSet
-            ds.add(entry)
-        # If a list is received
-        if lis is not None:
-            # Add the element to the list
-            lis.append(entry)
-        # Another element has been stored
-        stored = stored + 1
-        # Add it to the set so they are not repeated
-        s.add(entry)
-            
-    return
+from GenericHashFunctionsRegistry import hashFamilies, buildHash
+from SyntheticWorkload import SyntheticWorkload
 
 # Main function
 def main(argv):
@@ -73,18 +28,22 @@ def main(argv):
     hash_f = 'md5'
     # How many false positives are required to swap between groups of functions
     swap=1
+    # Seed used to generate the positives and negatives (random if None)
+    seed=None
+    # Keep the generated positives and negatives in data_test (requires a seed)
+    cache=False
 
     # Retrieve the option values from command line
     try:
-        opts, args = getopt.getopt(sys.argv[1:],"hb:w:k:g:f:a:s:")
+        opts, args = getopt.getopt(sys.argv[1:],"hb:w:k:g:f:a:s:r:c")
     except getopt.GetoptError:
-        print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -a <hash> -s <false_to_swap>')
+        print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -a <hash> -s <false_to_swap> -r <seed> -c')
         sys.exit(2)
         
     for opt, arg in opts:
         # Help option. Print help and leave.
         if opt == '-h':
-           print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -a <hash> -s <false_to_swap>')
+           print ('argv[0] -b <words> -w <width> -k <bits> -g <function_groups> -f <factor> -a <hash> -s <false_to_swap> -r <seed> -c')
            sys.exit()
         # -b option for setting the number of words in the filter
         elif opt == "-b":
@@ -102,19 +61,29 @@ def main(argv):
         # -f option to set the factor (factor x words will be stored)
         elif opt == "-f":
             factor=int(arg)
-        # -a option to change the default md5 hash to other ("sha512" supported)
+        # -a option to change the default md5 hash to other registered family
+        # (sha512, sha512b, blake2b, multshift)
         elif opt == "-a":
+            if arg not in hashFamilies:
+                print ('Unknown hash %s. Available: %s' % (arg, ", ".join(hashFamilies)))
+                sys.exit(2)
             hash_f = arg
         # -s option to change the number of false positives required to swap
         # between groups of functions.
         elif opt == "-s":
             swap = int(arg)
+        # -r option to set the seed used to generate the elements
+        elif opt == "-r":
+            seed = int(arg)
+        # -c option to store the generated elements and reuse them in later runs
+        elif opt == "-c":
+            cache = True
 
     # Pass the parameters to the run function
-    run(blocks, width, k, groups, factor, hash_f, swap)
+    run(blocks, width, k, groups, factor, hash_f, swap, seed, cache)
 
 # Run the actual experiment using the parameters received
-def run (blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1):        
+def run (blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1, seed=None, cache=False):
 
     # Factor A=mul*N for the different experiments
     mul = {1, 2, 3, 4, 5, 6, 7, 8, 9, 10}
@@ -153,6 +122,13 @@ def run (blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1):
     log.write(info+"\n")
     log2.write(info+"\n")
 
+    # Message printing the memory used by the fast memory (words and selectors) and the slow memory
+    footprint = GenericAdaptiveBloomFilter.geometry_footprint(blocks, width, groups)
+    info ="Memory footprint words=%d bytes, selectors=%d bytes, slow=%d bytes" % (footprint['words'], footprint['selectors'], footprint['slow'])
+    sc.write(info)
+    log.write(info+"\n")
+    log2.write(info+"\n")
+
     # For each of the A/N factors to be checked
     for i in mul:
         # Log the start of the experiment 
@@ -183,56 +159,59 @@ def run (blocks=1024, width=64, k=3, groups=2, factor=8, hash_f='md5', swap=1):
             # Create a dataset object
             ds = DataSet()
             # Create the Bloom Filter
-            if hash_f == 'sha512':
-                sha = GenericHashFunctionsSHA512(words=blocks, bits=width, nhash=k, hash_groups=groups)
-                abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=sha)
-            elif hash_f == 'sha512b':
-                sha = GenericHashFunctionsSHA512All(words=blocks, bits=width, nhash=k, hash_groups=groups)
-                abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=sha)
-            # Otherwise build it using the default MD5 hash
-            else:
-                abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups)
+            hash = buildHash(hash_f, words=blocks, bits=width, nhash=k, hash_groups=groups)
+            abf = GenericAdaptiveBloomFilter(words=blocks, bits=width, nhash=k, hash_groups=groups, hash_f=hash)
+
+            # Generators of the positives and the negatives for this experiment.
+            # With a seed, every experiment gets its own reproducible sequences
+            posgen = SyntheticWorkload(None if seed is None else (seed, i, completed, 0))
+            neggen = SyntheticWorkload(None if seed is None else (seed, i, completed, 1))
+            # Generator of the negatives to be tested
+            sampler = np.random.default_rng(None if seed is None else (seed, i, completed, 2))
+            # Names of the files to keep the elements, only if reproducible
+            poscache = negcache = None
+            if cache and seed is not None:
+                name = "_f%s_b%s_m%s_r%s_%s.npy" % (factor, blocks, i, seed, completed)
+                poscache = directory + positivesFile + name
+                negcache = directory + negativesFile + name
 
-            # Call to the generateRandomElements function to create
-            # the maxin positives that will be stored in the filter and the memory
-            while ds.length()<maxin:
-                generateRandomElements(maxin, abf, ds)
-                sc.write("length stored: %s" % ds.length())
+            # Create the maxin positives that will be stored in the filter and the memory
+            positives = posgen.generate(maxin, cache=poscache)
+            # Create the mul*maxin negatives that will be checked against the filter,
+            # excluding the positives
+            negatives = neggen.generate(maxin*i, exclude=positives, cache=negcache)
 
-            # Call to the generateRandomElements function to create
-            # the mul*maxin negatives that will be checked against the filter.
-            # Exclude the positives and check that everything worked properly
-                l.clear()
-                generateRandomElements(maxin*i, lis=l, exclude=ds.data)
-                if ds.data.isdisjoint(l):
-                    break
+            # Add the positives to the filter, to the slow memory backing it
+            # and to the DataSet
+            stored = SyntheticWorkload.elements(positives)
+            abf.add_many(stored)
+            abf.addslow_many(stored)
+            for entry in stored:
+                ds.add(entry)
+            sc.write("length stored: %s" % ds.length())
+            # Keep the negatives in the list
+            l.extend(SyntheticWorkload.elements(negatives))
+            # Check that everything worked properly
+            if not ds.data.isdisjoint(l):
                 sc.write("False positive found")
 
-            count = 0 # count of the tests performed
             fp=0 # false positives in this test
-            tn=0 # true negatives in this test
 
-            while True:
-                # finish if all the tests were run
-                if count >= totalTests:
-                    break
-                # select a random index among all the elements in the negative list
-                idx = random.randint(0,len(l)-1)
-                # extract the element
-                element = l[idx]
-                # By default, suppose it is a true negative
-                tn+=1
-                # Check if it gives a falso positive
-                if abf.check(element):
-                    # Add it to the false positive count
-                    fp+=1
-                    tn-=1 # No longer true negative
-                    # Swap between functions will ocurr every "swap" false
-                    # positives found. Use module operator to detect
-                    if fp%swap == 0:
-                        abf.swaphash(element) # Bloom filter adaptation
-                # A test has been completed
-                count+=1
+            # Hash every negative once, as the tests select them repeatedly
+            negwords, negmasks = abf.hash.indices_many(l, abf.lanes)
+            # select up front a random index among all the elements in the
+            # negative list for each of the tests
+            samples = sampler.integers(0, len(l), totalTests)
+            # None of the tested elements was stored
+            members = np.zeros(min(totalTests, abf.BATCH_SIZE), dtype=bool)
+            # Check the elements in batches. Every positive is a false positive,
+            # and the functions are swapped every "swap" false positives in the
+            # same order as checking them one at a time
+            for start in range(0, totalTests, abf.BATCH_SIZE):
+                idx = samples[start:start+abf.BATCH_SIZE]
+                results, fp = abf.check_adapt_indices(negwords[idx], negmasks[idx], members[:len(idx)], swap, fp)
+            # the rest of the tests are true negatives
+            tn = totalTests - fp
             # Print results of current iteration 
             info = "Iteration %s. FP=%d, TN=%d,FPR=%s." % (completed, fp, tn, fp/(fp+tn)) 
             sc.write(info)